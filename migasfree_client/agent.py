@@ -0,0 +1,379 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+migasfree agent: long-running client that synchronizes the computer
+periodically and on demand (migasfree -u, migasfree-tags --set)
+Periodic synchronizations follow the scheduler (jitter, server backoff)
+
+Protocol (UNIX socket, one JSON line per connection):
+    request: {"command": "sync", "force_upgrade": false}
+    response: {"code": <exit code of the synchronization>}
+"""
+
+import os
+import sys
+import errno
+import json
+import time
+import select
+import socket
+import logging
+import optparse
+
+import gettext
+_ = gettext.gettext
+
+from . import settings, utils, curl, network, peercache
+from .client import MigasFreeClient
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+__all__ = ('MigasFreeAgent', 'trigger', 'main')
+
+REQUEST_TIMEOUT = 5  # max seconds to receive a request line
+
+
+def _send_line(conn, data):
+    _line = json.dumps(data) + '\n'
+    if sys.version_info[0] > 2:
+        _line = bytes(_line, encoding='utf8')
+
+    conn.sendall(_line)
+
+
+def _recv_line(conn):
+    _data = b''
+    while not _data.endswith(b'\n'):
+        _chunk = conn.recv(4096)
+        if not _chunk:
+            break
+        _data += _chunk
+
+    return json.loads(_data.decode('utf8'))
+
+
+def _remove_socket(socket_file):
+    try:
+        os.remove(socket_file)
+    except OSError:
+        pass
+
+
+def trigger(force_upgrade=False, socket_file=settings.AGENT_SOCKET_FILE):
+    """
+    int trigger(bool force_upgrade=False, string socket_file)
+    asks a running agent for a synchronization and waits for it
+    returns exit code of the synchronization or None if no agent is running
+    """
+
+    if not os.path.exists(socket_file):
+        return None
+
+    _conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        _conn.connect(socket_file)
+        _send_line(_conn, {'command': 'sync', 'force_upgrade': force_upgrade})
+
+        return int(_recv_line(_conn)['code'])
+    except (socket.error, ValueError, KeyError, TypeError):
+        return None
+    finally:
+        _conn.close()
+
+
+class MigasFreeAgent(MigasFreeClient):
+    CMD = 'migasfree-agent'  # /usr/bin/migasfree-agent
+
+    _socket = None
+    _socket_file = settings.AGENT_SOCKET_FILE
+
+    _syncing = False
+    _stopping = False
+
+    _peer_cache = None
+
+    def _exit_gracefully(self, signal_number, frame):
+        self._stopping = True
+        if self._syncing:
+            MigasFreeClient._exit_gracefully(self, signal_number, frame)
+
+        logging.info('Exiting %s, signal: %s', self.CMD, signal_number)
+        sys.exit(os.EX_OK)
+
+    def _reload_config(self):
+        if not self.config.reload():
+            return
+
+        logging.info('Config file changed, reloading it')
+        self._read_config()
+
+        # connections to previous server (or through previous proxy) are released
+        self._close_session()
+        self._http_session = curl.Session()
+
+        self._ssl_cert()
+        self._init_url_request()
+
+    def _sync(self, force_upgrade=False):
+        """
+        int _sync(bool force_upgrade=False)
+        runs a synchronization with the same lock as migasfree command
+        returns exit code (as migasfree -u)
+        """
+
+        if not utils.acquire_lock_file(self.LOCK_FILE):
+            logging.warning('Another migasfree command is running')
+            return errno.EPERM
+
+        logging.info('Synchronization started (force upgrade: %s)', force_upgrade)
+        self._syncing = True
+        _ret = os.EX_OK
+        try:
+            self._reload_config()
+            self._init_environment()
+            self._pms_status_ok = True
+            if force_upgrade:
+                self.migas_auto_update_packages = True
+
+            self._update_system()
+            self._flush_messages()
+
+            if not self._pms_status_ok:
+                _ret = errno.EPROTO
+        except SystemExit as e:
+            _ret = e.code if isinstance(e.code, int) else errno.EPERM
+            if self._stopping:
+                raise
+        except Exception:
+            logging.exception('Synchronization error')
+            _ret = errno.EIO
+        finally:
+            self._syncing = False
+            self._finish_sync(_ret)
+            self._prune_peer_cache()
+            self.migas_auto_update_packages = self.config.auto_update_packages
+            if self._error_file_descriptor:
+                self._error_file_descriptor.close()
+                self._error_file_descriptor = None
+
+            utils.remove_file(self.LOCK_FILE)
+
+        logging.info('Synchronization finished: %s', _ret)
+
+        return _ret
+
+    def _start_peer_cache(self):
+        if not self.config.peer_cache_port:
+            return
+
+        _upstream = '{0}://{1}'.format(
+            'https' if self.migas_ssl_cert else 'http',
+            self.migas_package_proxy_cache or ''
+        )
+        # packages are shared with peers in local network
+        # (served in address of main interface, unless configured)
+        _network_info = network.get_network_info()
+        _network = _network_info.get('net')
+        _address = self.config.peer_cache_address or _network_info.get('ip', '')
+        self._peer_cache = peercache.PeerCache(
+            self.config.peer_cache_port,
+            _upstream,
+            self.migas_server,
+            self.migas_project,
+            peers=[
+                _peer.strip()
+                for _peer in self.config.peer_cache_peers.split(',')
+                if _peer.strip()
+            ],
+            networks=[_network] if _network else [],
+            cert=self.migas_ssl_cert,
+            proxy=self.migas_proxy,
+            address=_address
+        )
+        self._peer_cache.start()
+
+    def _prune_peer_cache(self):
+        if self._peer_cache:
+            self._peer_cache.prune(self.config.peer_cache_max_size * 1024 * 1024)
+
+    def _listen(self):
+        if os.path.exists(self._socket_file):
+            _conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                _conn.connect(self._socket_file)
+                print(_('Another instance of %s is running') % self.CMD)
+                sys.exit(errno.EPERM)
+            except socket.error:
+                _remove_socket(self._socket_file)  # stale socket
+            finally:
+                _conn.close()
+
+        _path = os.path.dirname(self._socket_file)
+        if not os.path.isdir(_path):
+            os.makedirs(_path, 0o755)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self._socket_file)
+        os.chmod(self._socket_file, 0o600)
+        self._socket.listen(5)
+
+    def _close(self):
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+            _remove_socket(self._socket_file)
+
+    def _accept(self):
+        """
+        tuple _accept(void)
+        returns (connection, request) or (None, None) if request is invalid
+        """
+
+        _conn, _address = self._socket.accept()
+        _conn.settimeout(REQUEST_TIMEOUT)
+        try:
+            _request = _recv_line(_conn)
+            if _request.get('command') == 'sync':
+                _conn.settimeout(None)
+                return _conn, _request
+        except (socket.error, ValueError, AttributeError):
+            pass
+
+        _conn.close()
+
+        return None, None
+
+    def _pending(self, timeout):
+        _readable, _, _ = select.select([self._socket], [], [], timeout)
+
+        return bool(_readable)
+
+    def _answer(self, clients, code):
+        for _conn in clients:
+            try:
+                _send_line(_conn, {'code': code})
+            except socket.error:
+                pass
+            finally:
+                _conn.close()
+
+    def _queued(self, clients):
+        """
+        bool _queued(list clients)
+        accepts pending requests (connections are appended to clients)
+        returns True if any of them forces upgrade
+        """
+
+        _force_upgrade = False
+        while self._pending(0):
+            _conn, _request = self._accept()
+            if _conn:
+                clients.append(_conn)
+                _force_upgrade |= bool(_request.get('force_upgrade'))
+
+        return _force_upgrade
+
+    def _serve(self, clients, force_upgrade):
+        """
+        requests queued when a synchronization starts are coalesced
+        (they are answered with its result)
+        requests received while synchronizing are served by a new one
+        (tags or config could have changed after previous one started)
+        """
+
+        while True:
+            force_upgrade |= self._queued(clients)
+            _ret = self._sync(force_upgrade)
+            self._answer(clients, _ret)
+
+            clients = []
+            force_upgrade = self._queued(clients)
+            if not clients:
+                return
+
+    def run(self):
+        _program = 'migasfree agent'
+        parser = optparse.OptionParser(
+            description=_program,
+            prog=self.CMD,
+            version=self.release,
+            usage='%prog options'
+        )
+
+        parser.add_option(
+            "--no-startup-sync", action="store_true",
+            help=_('Wait for an interval (or a trigger) before first sync')
+        )
+
+        parser.add_option(
+            "--refresh-identity", action="store_true",
+            help=_('Read hardware identity again (UUID, SMBIOS, MAC)')
+        )
+
+        options, arguments = parser.parse_args()
+
+        if options.refresh_identity:
+            utils.refresh_identity()
+
+        print(_('%(program)s version: %(version)s') % {
+            'program': _program,
+            'version': self.release
+        })
+
+        self._listen()
+        self._start_peer_cache()
+        self._show_running_options()
+
+        try:
+            _scheduler = self._scheduler()
+            if options.no_startup_sync:
+                _next_sync = time.time() + _scheduler.next_delay()
+            else:
+                _next_sync = time.time() + max(
+                    _scheduler.deferred(),
+                    _scheduler.splay(self.config.sync_splay)
+                )
+
+            while not self._stopping:
+                _delay = max(_next_sync - time.time(), 0)
+                logging.debug('Next synchronization in %d seconds', _delay)
+                if self._pending(_delay):
+                    _conn, _request = self._accept()
+                    if not _conn:
+                        continue
+
+                    self._serve([_conn], bool(_request.get('force_upgrade')))
+                else:
+                    self._serve([], False)
+
+                _next_sync = time.time() + self._scheduler().next_delay()
+        finally:
+            if self._peer_cache:
+                self._peer_cache.stop()
+            self._close()
+
+        sys.exit(os.EX_OK)
+
+
+def main():
+    mfa = MigasFreeAgent()
+    mfa.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -15,11 +15,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import re
 import logging
 
 from .pms import Pms
-from migasfree_client.utils import execute, write_file
+from . import dpkg_status
+from migasfree_client.utils import execute
 
 __author__ = 'Jose Antonio Chavarría'
 __license__ = 'GPLv3'
@@ -39,9 +41,14 @@ class Apt(Pms):
         self._pms = 'DEBIAN_FRONTEND=noninteractive /usr/bin/apt-get'  # Package Management System command
         self._repo = '/etc/apt/sources.list.d/migasfree.list'  # Repositories file
 
+        self._cache_paths = ['/var/cache/apt/archives']
+        self._archive_suffix = '.deb'
+
         self._pms_search = '/usr/bin/apt-cache'
         self._pms_query = '/usr/bin/dpkg-query'
 
+        self._upgrade_with_packages = None  # detected when needed
+
         self._silent_options = '-o APT::Get::Purge=true -o Dpkg::Options::=--force-confdef' \
             ' -o Dpkg::Options::=--force-confold -o Debug::pkgProblemResolver=1 ' \
             '--assume-yes --force-yes --allow-unauthenticated --auto-remove'
@@ -92,7 +99,8 @@ class Apt(Pms):
         _ret, _, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
         )
 
         return _ret == 0, _error
@@ -105,9 +113,8 @@ class Apt(Pms):
         if not isinstance(package_set, list):
             return False, 'package_set is not a list: %s' % package_set
 
-        for pkg in package_set[:]:
-            if self.is_installed(pkg):
-                package_set.remove(pkg)
+        _installed = self.installed_set(package_set)
+        package_set[:] = [_pkg for _pkg in package_set if _pkg not in _installed]
 
         if not package_set:
             return True, None
@@ -121,7 +128,92 @@ class Apt(Pms):
         _ret, _, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
+        )
+
+        return _ret == 0, _error
+
+    def prefetch(self, remove, install, upgrade=False):
+        """
+        (bool, string) prefetch(list remove, list install, bool upgrade=False)
+        """
+
+        remove, install = self._pending_changes(remove, install)
+
+        _commands = []
+        if remove or install:
+            # removals (pkg-) are resolved in the same transaction
+            _commands.append('install {0}'.format(
+                ' '.join(install + ['{0}-'.format(_pkg) for _pkg in remove])
+            ))
+        if upgrade:
+            _commands.append('dist-upgrade')
+
+        _errors = []
+        for _command in _commands:
+            self._cmd = '{0} {1} --download-only {2}'.format(
+                self._pms,
+                self._silent_options,
+                _command
+            )
+            logging.debug(self._cmd)
+            _ret, _, _error = execute(
+                self._cmd,
+                interactive=False,
+                sink=self._log_output
+            )
+            if _ret != 0:
+                _errors.append(_error)
+
+        return not _errors, '\n'.join(_errors) or None
+
+    def _upgrade_accepts_packages(self):
+        """
+        bool _upgrade_accepts_packages(void)
+        package arguments in dist-upgrade are allowed since apt 1.1
+        """
+
+        if self._upgrade_with_packages is None:
+            self._cmd = "{0} --compare-versions \"$({1} -W -f='${{Version}}' apt)\" ge 1.1".format(
+                self._pm,
+                self._pms_query
+            )
+            logging.debug(self._cmd)
+            self._upgrade_with_packages = execute(self._cmd, interactive=False)[0] == 0
+
+        return self._upgrade_with_packages
+
+    def _transaction(self, remove, install, upgrade=False):
+        """
+        (bool, string) _transaction(list remove, list install, bool upgrade=False)
+        """
+
+        remove, install = self._pending_changes(remove, install)
+        _packages = install + ['{0}-'.format(_pkg) for _pkg in remove]
+
+        if upgrade:
+            if _packages and not self._upgrade_accepts_packages():
+                return None  # steps in sequence
+
+            _command = 'dist-upgrade'
+        elif _packages:
+            _command = 'install'
+        else:
+            return True, None
+
+        self._cmd = '{0} {1} {2} {3}'.format(
+            self._pms,
+            self._silent_options,
+            _command,
+            ' '.join(_packages)
+        ).strip()
+        logging.debug(self._cmd)
+        _ret, _, _error = execute(
+            self._cmd,
+            interactive=False,
+            verbose=True,
+            sink=self._log_output
         )
 
         return _ret == 0, _error
@@ -134,9 +226,8 @@ class Apt(Pms):
         if not isinstance(package_set, list):
             return False, 'package_set is not a list: %s' % package_set
 
-        for pkg in package_set[:]:
-            if not self.is_installed(pkg):
-                package_set.remove(pkg)
+        _installed = self.installed_set(package_set)
+        package_set[:] = [_pkg for _pkg in package_set if _pkg in _installed]
 
         if not package_set:
             return True, None
@@ -150,7 +241,8 @@ class Apt(Pms):
         _ret, _, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
         )
 
         return _ret == 0, _error
@@ -168,6 +260,31 @@ class Apt(Pms):
 
         return execute(self._cmd, interactive=False)[0] == 0
 
+    def installed_set(self, packages):
+        """
+        set installed_set(list packages)
+        """
+
+        if not packages:
+            return set()
+
+        self._cmd = "LC_ALL=C {0} --show --showformat='${{Package}} ${{Architecture}} ${{Status}}\\n' {1}".format(
+            self._pms_query,
+            ' '.join(_pkg.strip() for _pkg in packages)
+        )
+        logging.debug(self._cmd)
+        # return code is not 0 if any package is unknown
+        _, _output, _ = execute(self._cmd, interactive=False)
+
+        _installed = set()
+        for _line in _output.splitlines():
+            _info = _line.split(' ', 2)
+            if len(_info) == 3 and _info[2].strip() == 'install ok installed':
+                _installed.add(_info[0])
+                _installed.add('{0}:{1}'.format(_info[0], _info[1]))
+
+        return set(_pkg for _pkg in packages if _pkg.strip() in _installed)
+
     def clean_all(self):
         """
         bool clean_all(void)
@@ -187,6 +304,13 @@ class Apt(Pms):
         ordered list query_all(void)
         """
 
+        # reading dpkg database avoids 'dpkg --list' process and formatting
+        if os.path.isfile(dpkg_status.STATUS_FILE):
+            try:
+                return dpkg_status.installed_packages()
+            except (IOError, OSError):
+                logging.exception('Reading %s', dpkg_status.STATUS_FILE)
+
         _, _packages, _ = execute(
             '{0} --list'.format(self._pm),
             interactive=False
@@ -203,9 +327,41 @@ class Apt(Pms):
 
         return _result
 
-    def create_repos(self, protocol, server, project, repositories, template=''):
+    def package_names(self, packages):
         """
-        bool create_repos(string protocol, string server, string project, list repositories, string template='')
+        dict package_names(list packages)
+        """
+
+        _names = {}
+        if os.path.isfile(dpkg_status.STATUS_FILE):
+            try:
+                _names = dpkg_status.package_names()
+            except (IOError, OSError):
+                logging.exception('Reading %s', dpkg_status.STATUS_FILE)
+
+        _result = {}
+        for _pkg in packages:
+            _result[_pkg] = _names.get(_pkg)
+            if not _result[_pkg]:
+                # without dpkg database: versions start with a digit
+                _result[_pkg] = re.split(r'-(?=\d)', _pkg, maxsplit=1)[0]
+
+        return _result
+
+    def refresh_metadata(self):
+        """
+        bool refresh_metadata(void)
+        """
+
+        # only changed indexes are downloaded (If-Modified-Since, pdiffs)
+        self._cmd = '{0} -o Acquire::Languages=none --assume-yes update'.format(self._pms)
+        logging.debug(self._cmd)
+
+        return execute(self._cmd)[0] == 0
+
+    def render_repos(self, protocol, server, project, repositories, template=''):
+        """
+        string render_repos(string protocol, string server, string project, list repositories, string template='')
         """
 
         content = ''
@@ -222,7 +378,27 @@ class Apt(Pms):
                     repo=repo['name']
                 )
 
-        return write_file(self._repo, content)
+        return content
+
+    def metadata_urls(self, content):
+        """
+        list metadata_urls(string content)
+        """
+
+        _urls = []
+        for _line in content.splitlines():
+            # deb [options] uri suite [component...]
+            _fields = re.sub(r'\[[^\]]*\]', ' ', _line.split('#')[0]).split()
+            if len(_fields) < 3 or _fields[0] != 'deb':
+                continue
+
+            _uri, _suite = _fields[1].rstrip('/'), _fields[2]
+            if _suite.endswith('/'):  # flat repository
+                _urls.append('{0}/{1}Release'.format(_uri, _suite))
+            else:
+                _urls.append('{0}/dists/{1}/Release'.format(_uri, _suite))
+
+        return _urls
 
     def import_server_key(self, file_key):
         """
@@ -0,0 +1,135 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Reader of dpkg status database (without spawning dpkg processes)
+Package names are formatted like 'dpkg --list' does (non ambiguous names)
+"""
+
+import io
+import os
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+STATUS_FILE = '/var/lib/dpkg/status'
+
+_FIELDS = ['Package', 'Status', 'Version', 'Architecture', 'Multi-Arch']
+
+_cache = {}  # {filename: ((mtime, size), [('name-version', name), ...])}
+
+
+def _paragraphs(stream):
+    """
+    iterator _paragraphs(file stream)
+    yields a dict (only interesting fields) for each package
+    """
+
+    _paragraph = {}
+    for _line in stream:
+        if not _line.strip():
+            if _paragraph:
+                yield _paragraph
+            _paragraph = {}
+            continue
+
+        if _line[0] in ' \t':
+            continue  # multiline field
+
+        _field, _sep, _value = _line.partition(':')
+        if _sep and _field in _FIELDS:
+            _paragraph[_field] = _value.strip()
+
+    if _paragraph:
+        yield _paragraph
+
+
+def _is_installed(paragraph):
+    # same as 'ii' in 'dpkg --list'
+    _status = paragraph.get('Status', '').split()
+
+    return len(_status) == 3 and _status[0] == 'install' \
+        and _status[2] == 'installed'
+
+
+def _parse(filename):
+    _installed = []
+    _native_arch = None
+
+    with io.open(filename, encoding='utf-8', errors='replace') as _stream:
+        for _paragraph in _paragraphs(_stream):
+            if _paragraph.get('Package') == 'dpkg':
+                _native_arch = _paragraph.get('Architecture')
+
+            if _is_installed(_paragraph):
+                _installed.append(_paragraph)
+
+    _result = []
+    for _paragraph in sorted(
+        _installed,
+        key=lambda x: (x['Package'], x.get('Architecture', ''))
+    ):
+        _name = _paragraph['Package']
+        _arch = _paragraph.get('Architecture', '')
+        if _arch and (
+            _paragraph.get('Multi-Arch') == 'same'
+            or _arch not in [_native_arch, 'all']
+        ):
+            _name = '{0}:{1}'.format(_name, _arch)
+
+        _result.append(
+            ('{0}-{1}'.format(_name, _paragraph.get('Version', '')), _name)
+        )
+
+    return _result
+
+
+def _installed(filename):
+    """
+    list _installed(string filename)
+    ordered ('name-version', name) of installed packages
+    (cached while status file is not modified)
+    """
+
+    if filename is None:
+        filename = STATUS_FILE
+
+    _stat = os.stat(filename)
+    _key = (_stat.st_mtime, _stat.st_size)
+    if filename not in _cache or _cache[filename][0] != _key:
+        _cache[filename] = (_key, _parse(filename))
+
+    return _cache[filename][1]
+
+
+def installed_packages(filename=None):
+    """
+    list installed_packages(string filename=STATUS_FILE)
+    returns ordered 'name-version' list of installed packages
+    """
+
+    return [_package for _package, _ in _installed(filename)]
+
+
+def package_names(filename=None):
+    """
+    dict package_names(string filename=STATUS_FILE)
+    returns {'name-version': name} of installed packages
+    (versions can contain '-', so names can not be split from the string)
+    """
+
+    return dict(_installed(filename))
@@ -15,6 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import time
+import logging
+
+from migasfree_client.utils import write_file
+
 __author__ = 'Jose Antonio Chavarría'
 __license__ = 'GPLv3'
 
@@ -49,6 +55,17 @@ class Pms(object):
         self._repo = ''  # Repositories file
         self._cmd = ''   # Command to execute
 
+        self._cache_paths = []     # Downloaded packages directories
+        self._archive_suffix = ''  # Package file extension
+
+    def _log_output(self, line):
+        """
+        void _log_output(string line)
+        output of package transactions is kept in log file
+        """
+
+        logging.info('%s: %s', self._name, line)
+
     def __str__(self):
         """
         string __str__(void)
@@ -105,6 +122,86 @@ class Pms(object):
 
         raise NotImplementedError
 
+    def installed_set(self, packages):
+        """
+        set installed_set(list packages)
+        returns installed packages of the list
+        (backends should ask for all packages at once)
+        """
+
+        return set(_pkg for _pkg in packages if self.is_installed(_pkg))
+
+    def _pending_changes(self, remove, install):
+        """
+        (list, list) _pending_changes(list remove, list install)
+        packages to remove that are installed and packages to install that are not
+        """
+
+        _installed = self.installed_set(list(remove) + list(install))
+
+        return (
+            [_pkg for _pkg in remove if _pkg in _installed],
+            [_pkg for _pkg in install if _pkg not in _installed]
+        )
+
+    def prefetch(self, remove, install, upgrade=False):
+        """
+        (bool, string) prefetch(list remove, list install, bool upgrade=False)
+        downloads archives of the whole transaction (nothing is installed)
+        """
+
+        return True, None
+
+    def _transaction(self, remove, install, upgrade=False):
+        """
+        (bool, string) _transaction(list remove, list install, bool upgrade=False)
+        one dependency resolution of the whole transaction
+        (None if backend does not support it)
+        """
+
+        return None
+
+    def _sequence(self, remove, install, upgrade=False):
+        """
+        (bool, string) _sequence(list remove, list install, bool upgrade=False)
+        silent methods are run in sequence (a failed step does not stop
+        the next ones)
+        """
+
+        _results = [
+            self.remove_silent(list(remove)),
+            self.install_silent(list(install))
+        ]
+        if upgrade:
+            _results.append(self.update_silent())
+
+        _errors = [str(_error) for _ret, _error in _results if not _ret]
+
+        return not _errors, '\n'.join(_errors) or None
+
+    def transaction(self, remove, install, upgrade=False):
+        """
+        (bool, string) transaction(list remove, list install, bool upgrade=False)
+        removes, installs and upgrades packages in one dependency resolution
+        If it fails (p.e. a package is not available), steps are run in
+        sequence: upgrades are not blocked by packages that can not be
+        installed
+        """
+
+        _result = self._transaction(list(remove), list(install), upgrade)
+        if _result is None:
+            return self._sequence(remove, install, upgrade)
+
+        _ret, _error = _result
+        if not _ret:
+            logging.warning(
+                '%s: transaction failed, steps are run in sequence: %s',
+                self._name, _error
+            )
+            return self._sequence(remove, install, upgrade)
+
+        return True, None
+
     def clean_all(self):
         """
         bool clean_all(void)
@@ -119,12 +216,161 @@ class Pms(object):
 
         raise NotImplementedError
 
+    def package_names(self, packages):
+        """
+        dict package_names(list packages)
+        returns {package: name} of installed packages (query_all format)
+        """
+
+        raise NotImplementedError
+
+    def changes(self, before, after):
+        """
+        (list, list, list) changes(list before, list after)
+        returns installed, removed and upgraded packages between two
+        inventories (query_all format). A package with another version
+        is upgraded (not installed and removed)
+        """
+
+        _added = sorted(set(after) - set(before))
+        _names = self.package_names(_added)
+        _installed = dict((_names[_pkg], _pkg) for _pkg in _added)
+
+        _removed = []
+        _upgraded = []
+        for _pkg in sorted(set(before) - set(after)):
+            # name of a removed package: longest prefix before a '-'
+            # that is the name of an installed package
+            _parts = _pkg.split('-')
+            for _i in range(len(_parts) - 1, 0, -1):
+                _name = '-'.join(_parts[:_i])
+                if _name in _installed:
+                    _upgraded.append(_installed.pop(_name))
+                    break
+            else:
+                _removed.append(_pkg)
+
+        return sorted(_installed.values()), _removed, sorted(_upgraded)
+
+    def render_repos(self, protocol, server, project, repositories, template=''):
+        """
+        string render_repos(string protocol, string server, string project, list repositories, string template='')
+        returns content of repositories file
+        """
+
+        raise NotImplementedError
+
+    def _is_repos_file(self, content):
+        try:
+            with open(self._repo, 'rb') as _fp:
+                _current = _fp.read()
+        except IOError:
+            return False
+
+        if not isinstance(content, bytes):
+            content = content.encode('utf8')
+
+        return _current == content
+
     def create_repos(self, protocol, server, project, repositories, template=''):
         """
         bool create_repos(string protocol, string server, string project, list repositories, string template='')
+        repositories file is not rewritten if its content is unchanged
         """
 
-        raise NotImplementedError
+        _content = self.render_repos(
+            protocol, server, project, repositories, template
+        )
+        if self._is_repos_file(_content):
+            logging.debug('Repositories file unchanged: %s', self._repo)
+            return True
+
+        return write_file(self._repo, _content)
+
+    def metadata_urls(self, content):
+        """
+        list metadata_urls(string content)
+        returns URLs of metadata index (Release, repomd.xml)
+        of repositories in content (a rendered repositories file)
+        default: repomd.xml of baseurl entries (yum, zypper)
+        """
+
+        _urls = []
+        for _line in content.splitlines():
+            _key, _sep, _value = _line.partition('=')
+            _value = _value.strip()
+            # URLs with variables ($releasever, $basearch) are not expanded
+            if _sep and _key.strip() == 'baseurl' and '$' not in _value:
+                _urls.append('{0}/repodata/repomd.xml'.format(_value.rstrip('/')))
+
+        return _urls
+
+    def _cached_archives(self):
+        """
+        list _cached_archives(void)
+        returns [(last use, size, path)] of downloaded packages
+        """
+
+        _archives = []
+        for _path in self._cache_paths:
+            for _root, _dirs, _files in os.walk(_path):
+                for _file in _files:
+                    if not _file.endswith(self._archive_suffix):
+                        continue
+
+                    _filename = os.path.join(_root, _file)
+                    try:
+                        _stat = os.stat(_filename)
+                    except OSError:
+                        continue
+
+                    _archives.append((
+                        max(_stat.st_atime, _stat.st_mtime),
+                        _stat.st_size,
+                        _filename
+                    ))
+
+        return _archives
+
+    def prune_cache(self, max_size, max_age):
+        """
+        int prune_cache(int max_size, int max_age)
+        removes downloaded packages not used in max_age seconds and then
+        least recently used ones until cache size is under max_size bytes
+        returns freed bytes
+        """
+
+        if not self._archive_suffix:
+            return 0
+
+        _archives = sorted(self._cached_archives(), reverse=True)  # MRU first
+        _limit = time.time() - max_age
+        _size = 0
+        _freed = 0
+        for _last_use, _file_size, _filename in _archives:
+            if _last_use >= _limit and _size + _file_size <= max_size:
+                _size += _file_size
+                continue
+
+            try:
+                os.remove(_filename)
+                _freed += _file_size
+            except OSError:
+                logging.warning('Package cache: %s not removed', _filename)
+
+        logging.debug(
+            'Package cache: %d bytes kept, %d bytes freed', _size, _freed
+        )
+
+        return _freed
+
+    def refresh_metadata(self):
+        """
+        bool refresh_metadata(void)
+        incremental update of repositories metadata (cache is not cleaned)
+        """
+
+        return self.clean_all()
 
     def import_server_key(self, file_key):
         """
@@ -17,10 +17,11 @@
 
 import os
 import logging
+import tempfile
 
 from .pms import Pms
 from migasfree_client import settings
-from migasfree_client.utils import execute, write_file
+from migasfree_client.utils import execute, write_file, remove_file
 
 __author__ = 'Jose Antonio Chavarría'
 __license__ = 'GPLv3'
@@ -45,6 +46,12 @@ class Yum(Pms):
         else:
             self._repo = '/etc/yum/repos.d/migasfree.repo'
 
+        # downloaded packages are kept (cache is pruned by prune_cache)
+        self._silent_options = '--assumeyes --setopt=keepcache=1'
+
+        self._cache_paths = ['/var/cache/yum', '/var/cache/dnf']
+        self._archive_suffix = '.rpm'
+
     def install(self, package):
         """
         bool install(string package)
@@ -80,12 +87,13 @@ class Yum(Pms):
         (bool, string) update_silent(void)
         """
 
-        self._cmd = '{0} --assumeyes update'.format(self._pms)
+        self._cmd = '{0} {1} update'.format(self._pms, self._silent_options)
         logging.debug(self._cmd)
         _ret, _, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
         )
 
         return _ret == 0, _error
@@ -98,26 +106,103 @@ class Yum(Pms):
         if not isinstance(package_set, list):
             return False, 'package_set is not a list: %s' % package_set
 
-        for pkg in package_set[:]:
-            if self.is_installed(pkg):
-                package_set.remove(pkg)
+        _installed = self.installed_set(package_set)
+        package_set[:] = [_pkg for _pkg in package_set if _pkg not in _installed]
 
         if not package_set:
             return True, None
 
-        self._cmd = '{0} --assumeyes install {1}'.format(
+        self._cmd = '{0} {1} install {2}'.format(
             self._pms,
+            self._silent_options,
             ' '.join(package_set)
         )
         logging.debug(self._cmd)
         _ret, _, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
         )
 
         return _ret == 0, _error
 
+    def prefetch(self, remove, install, upgrade=False):
+        """
+        (bool, string) prefetch(list remove, list install, bool upgrade=False)
+        removals do not download anything
+        """
+
+        _, install = self._pending_changes([], install)
+
+        _commands = []
+        if install:
+            _commands.append('install {0}'.format(' '.join(install)))
+        if upgrade:
+            _commands.append('update')
+
+        _errors = []
+        for _command in _commands:
+            self._cmd = '{0} {1} --downloadonly {2}'.format(
+                self._pms,
+                self._silent_options,
+                _command
+            )
+            logging.debug(self._cmd)
+            _ret, _, _error = execute(
+                self._cmd,
+                interactive=False,
+                sink=self._log_output
+            )
+            if _ret != 0:
+                _errors.append(_error)
+
+        return not _errors, '\n'.join(_errors) or None
+
+    def _transaction(self, remove, install, upgrade=False):
+        """
+        (bool, string) _transaction(list remove, list install, bool upgrade=False)
+        commands are run in a yum shell (one transaction, also in dnf)
+        """
+
+        remove, install = self._pending_changes(remove, install)
+
+        _commands = []
+        if remove:
+            _commands.append('remove {0}'.format(' '.join(remove)))
+        if install:
+            _commands.append('install {0}'.format(' '.join(install)))
+        if upgrade:
+            _commands.append('update')
+
+        if not _commands:
+            return True, None
+
+        _commands.append('run')
+
+        _fd, _script = tempfile.mkstemp(suffix='.yum')
+        os.close(_fd)
+        write_file(_script, '\n'.join(_commands) + '\n')
+        logging.debug('yum shell script: %s', _commands)
+
+        self._cmd = '{0} {1} shell {2}'.format(
+            self._pms,
+            self._silent_options,
+            _script
+        )
+        logging.debug(self._cmd)
+        try:
+            _ret, _, _error = execute(
+                self._cmd,
+                interactive=False,
+                verbose=True,
+                sink=self._log_output
+            )
+        finally:
+            remove_file(_script)
+
+        return _ret == 0, _error
+
     def remove_silent(self, package_set):
         """
         (bool, string) remove_silent(list package_set)
@@ -126,9 +211,8 @@ class Yum(Pms):
         if not isinstance(package_set, list):
             return False, 'package_set is not a list: %s' % package_set
 
-        for pkg in package_set[:]:
-            if not self.is_installed(pkg):
-                package_set.remove(pkg)
+        _installed = self.installed_set(package_set)
+        package_set[:] = [_pkg for _pkg in package_set if _pkg in _installed]
 
         if not package_set:
             return True, None
@@ -141,7 +225,8 @@ class Yum(Pms):
         _ret, _, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
         )
 
         return _ret == 0, _error
@@ -156,6 +241,28 @@ class Yum(Pms):
 
         return execute(self._cmd, interactive=False)[0] == 0
 
+    def installed_set(self, packages):
+        """
+        set installed_set(list packages)
+        """
+
+        if not packages:
+            return set()
+
+        self._cmd = 'LC_ALL=C {0} -q {1}'.format(
+            self._pm,
+            ' '.join(_pkg.strip() for _pkg in packages)
+        )
+        logging.debug(self._cmd)
+        # return code is the number of not installed packages
+        _, _output, _ = execute(self._cmd, interactive=False)
+        _not_installed = set(_output.splitlines())
+
+        return set(
+            _pkg for _pkg in packages
+            if 'package {0} is not installed'.format(_pkg.strip()) not in _not_installed
+        )
+
     def clean_all(self):
         """
         bool clean_all(void)
@@ -184,9 +291,28 @@ class Yum(Pms):
 
         return sorted(_output.strip().splitlines())
 
-    def create_repos(self, protocol, server, project, repositories, template=''):
+    def package_names(self, packages):
+        """
+        dict package_names(list packages)
+        """
+
+        # name-version-release.arch (version and release have no '-')
+        return dict((_pkg, _pkg.rsplit('-', 2)[0]) for _pkg in packages)
+
+    def refresh_metadata(self):
+        """
+        bool refresh_metadata(void)
+        """
+
+        # repomd.xml is checked again, only changed metadata is downloaded
+        self._cmd = '{0} --assumeyes makecache'.format(self._pms)
+        logging.debug(self._cmd)
+
+        return execute(self._cmd)[0] == 0
+
+    def render_repos(self, protocol, server, project, repositories, template=''):
         """
-        bool create_repos(string protocol, string server, string project, list repositories, string template='')
+        string render_repos(string protocol, string server, string project, list repositories, string template='')
         """
 
         content = ''
@@ -208,7 +334,7 @@ http_caching=none
 metadata_expire=1
 """.format(url=template.format(server=server, project=project), repo=repo['name'])
 
-        return write_file(self._repo, content)
+        return content
 
     def import_server_key(self, file_key):
         """
@@ -19,7 +19,7 @@ import logging
 
 from .pms import Pms
 from migasfree_client import settings
-from migasfree_client.utils import execute, write_file
+from migasfree_client.utils import execute
 
 __author__ = 'Jose Antonio Chavarría'
 __license__ = 'GPLv3'
@@ -39,6 +39,9 @@ class Zypper(Pms):
         self._pms = '/usr/bin/zypper'  # Package Management System command
         self._repo = '/etc/zypp/repos.d/migasfree.repo'  # Repositories file
 
+        self._cache_paths = ['/var/cache/zypp/packages']
+        self._archive_suffix = '.rpm'
+
     def install(self, package):
         """
         bool install(string package)
@@ -82,7 +85,8 @@ class Zypper(Pms):
         _ret, _output, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
         )
         if _ret != 0:
             return False, '{0}\n{1}\n{2}'.format(_ret, _output, _error)
@@ -92,7 +96,8 @@ class Zypper(Pms):
         _ret, _output, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
         )
 
         return _ret == 0, '{0}\n{1}\n{2}'.format(_ret, _output, _error)
@@ -105,9 +110,8 @@ class Zypper(Pms):
         if not isinstance(package_set, list):
             return False, 'package_set is not a list: %s' % package_set
 
-        for pkg in package_set[:]:
-            if self.is_installed(pkg):
-                package_set.remove(pkg)
+        _installed = self.installed_set(package_set)
+        package_set[:] = [_pkg for _pkg in package_set if _pkg not in _installed]
 
         if not package_set:
             return True, None
@@ -120,11 +124,44 @@ class Zypper(Pms):
         _ret, _output, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
         )
 
         return _ret == 0, '{0}\n{1}\n{2}'.format(_ret, _output, _error)
 
+    def prefetch(self, remove, install, upgrade=False):
+        """
+        (bool, string) prefetch(list remove, list install, bool upgrade=False)
+        removals do not download anything
+        """
+
+        _, install = self._pending_changes([], install)
+
+        _commands = []
+        if install:
+            _commands.append(
+                'install --download-only --no-force-resolution -- {0}'.format(
+                    ' '.join(install)
+                )
+            )
+        if upgrade:
+            _commands.append('update --download-only --no-force-resolution')
+
+        _errors = []
+        for _command in _commands:
+            self._cmd = '{0} --non-interactive {1}'.format(self._pms, _command)
+            logging.debug(self._cmd)
+            _ret, _output, _error = execute(
+                self._cmd,
+                interactive=False,
+                sink=self._log_output
+            )
+            if _ret != 0:
+                _errors.append('{0}\n{1}\n{2}'.format(_ret, _output, _error))
+
+        return not _errors, '\n'.join(_errors) or None
+
     def remove_silent(self, package_set):
         """
         (bool, string) remove_silent(list package_set)
@@ -133,9 +170,8 @@ class Zypper(Pms):
         if not isinstance(package_set, list):
             return False, 'package_set is not a list: %s' % package_set
 
-        for pkg in package_set[:]:
-            if not self.is_installed(pkg):
-                package_set.remove(pkg)
+        _installed = self.installed_set(package_set)
+        package_set[:] = [_pkg for _pkg in package_set if _pkg in _installed]
 
         if not package_set:
             return True, None
@@ -148,7 +184,8 @@ class Zypper(Pms):
         _ret, _output, _error = execute(
             self._cmd,
             interactive=False,
-            verbose=True
+            verbose=True,
+            sink=self._log_output
         )
 
         return _ret == 0, '{0}\n{1}\n{2}'.format(_ret, _output, _error)
@@ -163,6 +200,28 @@ class Zypper(Pms):
 
         return execute(self._cmd, interactive=False)[0] == 0
 
+    def installed_set(self, packages):
+        """
+        set installed_set(list packages)
+        """
+
+        if not packages:
+            return set()
+
+        self._cmd = 'LC_ALL=C {0} -q {1}'.format(
+            self._pm,
+            ' '.join(_pkg.strip() for _pkg in packages)
+        )
+        logging.debug(self._cmd)
+        # return code is the number of not installed packages
+        _, _output, _ = execute(self._cmd, interactive=False)
+        _not_installed = set(_output.splitlines())
+
+        return set(
+            _pkg for _pkg in packages
+            if 'package {0} is not installed'.format(_pkg.strip()) not in _not_installed
+        )
+
     def clean_all(self):
         """
         bool clean_all(void)
@@ -190,9 +249,28 @@ class Zypper(Pms):
 
         return sorted(_output.strip().splitlines())
 
-    def create_repos(self, protocol, server, project, repositories, template=''):
+    def package_names(self, packages):
+        """
+        dict package_names(list packages)
+        """
+
+        # name-version-release.arch (version and release have no '-')
+        return dict((_pkg, _pkg.rsplit('-', 2)[0]) for _pkg in packages)
+
+    def refresh_metadata(self):
+        """
+        bool refresh_metadata(void)
+        """
+
+        # only repositories with changed repomd.xml are downloaded
+        self._cmd = '{0} --non-interactive refresh'.format(self._pms)
+        logging.debug(self._cmd)
+
+        return execute(self._cmd)[0] == 0
+
+    def render_repos(self, protocol, server, project, repositories, template=''):
         """
-        bool create_repos(string protocol, string server, string project, list repositories, string template='')
+        string render_repos(string protocol, string server, string project, list repositories, string template='')
         """
 
         content = ''
@@ -210,11 +288,12 @@ name={repo}
 baseurl={url}/{repo}
 gpgcheck=0
 enabled=1
+keeppackages=1
 http_caching=none
 metadata_expire=1
 """.format(url=template.format(server=server, project=project), repo=repo['name'])
 
-        return write_file(self._repo, content)
+        return content
 
     def import_server_key(self, file_key):
         """
@@ -0,0 +1,61 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Client state persisted between runs (JSON files in CACHE_PATH)
+"""
+
+import os
+import json
+import logging
+
+from . import settings, utils
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+
+def _filename(name):
+    return os.path.join(settings.CACHE_PATH, '{0}.json'.format(name))
+
+
+def load(name, default=None):
+    """
+    data load(string name, data default=None)
+    """
+
+    try:
+        with open(_filename(name)) as _fp:
+            return json.load(_fp)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def save(name, data):
+    """
+    bool save(string name, data)
+    """
+
+    _ret = utils.write_file_atomically(_filename(name), json.dumps(data))
+    if not _ret:
+        logging.warning('Cache %s not saved', name)
+
+    return _ret
+
+
+def remove(name):
+    utils.remove_file(_filename(name))
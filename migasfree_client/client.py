@@ -25,6 +25,8 @@ import time
 import tempfile
 import platform
 import socket
+import collections
+import threading
 
 try:
     import cups
@@ -37,10 +39,16 @@ import signal
 from . import (
     settings,
     utils,
+    cache,
     server_errors,
     printcolor,
     network,
     curl,
+    scheduler,
+    messages,
+    timing,
+    metrics,
+    peercache,
 )
 
 from .command import MigasFreeCommand
@@ -65,6 +73,18 @@ class MigasFreeClient(MigasFreeCommand):
 
     _pms_status_ok = True  # indicates the status of transactions with PMS
 
+    FAULT_TIMEOUT = 60  # max seconds for each fault evaluation
+
+    _sync_hint = None  # seconds requested by server before next sync
+
+    _message_sender = None
+
+    _sync_stats = {}  # metrics of current synchronization
+
+    _repos_fingerprint = None
+    METADATA_MAX_AGE = 24 * 60 * 60  # metadata is refreshed at least daily
+    MESSAGE_INTERVAL = 5  # min seconds between status messages sent
+
     def __init__(self):
         self._user_is_not_root()
 
@@ -143,6 +163,9 @@ class MigasFreeClient(MigasFreeCommand):
         if not self._error_file_descriptor:
             self._error_file_descriptor = open(self.ERROR_FILE, _mode)
 
+        if self._sync_stats:
+            self._sync_stats['errors'] += 1
+
         _text = '{0}\n{1}\n{2}\n\n'.format(
             '-' * 20,
             time.strftime("%Y-%m-%d %H:%M:%S"),
@@ -170,10 +193,7 @@ class MigasFreeClient(MigasFreeCommand):
                 except:
                     pass
 
-    def _send_message(self, msg='', icon=None):
-        if msg:
-            self._show_message(msg, icon)
-
+    def _upload_message(self, msg):
         _ret = self._url_request.run(
             'upload_computer_message',
             data=msg,
@@ -183,32 +203,77 @@ class MigasFreeClient(MigasFreeCommand):
         if self._debug:
             print('Message response: %s' % _ret)
 
-        if 'errmfs' in _ret \
-                and _ret['errmfs']['code'] == server_errors.COMPUTER_NOT_FOUND:
+        return _ret
+
+    def _check_message_response(self, response):
+        if 'errmfs' in response \
+                and response['errmfs']['code'] == server_errors.COMPUTER_NOT_FOUND:
             logging.warning('Computer not found.')
             return self._auto_register()
 
-        if _ret['errmfs']['code'] != server_errors.ALL_OK:
+        if response['errmfs']['code'] != server_errors.ALL_OK:
             _msg = 'Error: %s\nInfo: %s' % (
-                server_errors.error_info(_ret['errmfs']['code']),
-                _ret['errmfs']['info']
+                server_errors.error_info(response['errmfs']['code']),
+                response['errmfs']['info']
             )
             self.operation_failed(_msg)
-            if _ret['errmfs']['code'] == server_errors.UNSUBSCRIBED_COMPUTER:
+            if response['errmfs']['code'] == server_errors.UNSUBSCRIBED_COMPUTER:
                 sys.exit(errno.EPERM)
             self._write_error(_msg, append=True)
 
-        return _ret['errmfs']['code'] == server_errors.ALL_OK
+        return response['errmfs']['code'] == server_errors.ALL_OK
+
+    def _check_sent_messages(self):
+        if self._message_sender is None:
+            return
+
+        for _response in self._message_sender.responses():
+            self._check_message_response(_response)
+
+    def _send_message(self, msg='', icon=None, wait=False):
+        """
+        bool _send_message(string msg='', string icon=None, bool wait=False)
+        status messages are sent in background (only the latest pending
+        one is sent); wait=True sends msg now and returns server status
+        """
+        if msg:
+            self._show_message(msg, icon)
+
+        if wait:
+            if self._message_sender is not None:
+                self._message_sender.flush()
+                self._check_sent_messages()
+
+            return self._check_message_response(self._upload_message(msg))
+
+        if self._message_sender is None:
+            self._message_sender = messages.MessageSender(
+                self._upload_message,
+                interval=self.MESSAGE_INTERVAL
+            )
+
+        self._check_sent_messages()
+        self._message_sender.post(msg)
+
+        return True
 
-    def _eval_code(self, name, lang, code):
+    def _flush_messages(self):
+        if self._message_sender is not None:
+            self._message_sender.flush()
+            self._check_sent_messages()
+
+    def _run_code(self, name, lang, code, timeout=60):
+        """
+        executes code without side effects (safe to call from threads)
+        """
         # clean code...
         code = code.replace('\r', '').strip()
         logging.debug('Name: %s', name)
         logging.debug('Language code: %s', lang)
         logging.debug('Code: %s', code)
 
-        _filename = tempfile.mkstemp()[1]
-        with open(_filename, 'wb') as _code_file:
+        _fd, _filename = tempfile.mkstemp()
+        with os.fdopen(_fd, 'wb') as _code_file:
             if sys.version_info[0] <= 2:
                 _code_file.write(code)
             else:
@@ -229,22 +294,27 @@ class MigasFreeClient(MigasFreeCommand):
         else:
             _cmd = ':'  # gracefully degradation
 
-        _ret, _output, _error = utils.timeout_execute(_cmd)
+        _ret, _output, _error = utils.timeout_execute(_cmd, timeout)
         logging.debug('Executed command: %s', _cmd)
         logging.debug('Output: %s', _output)
         if _ret != 0:
             logging.error('Error: %s', _error)
-            _msg = _('Name "%s"\n') % name
-            _msg += _('Code "%s" with error: %s') % (code, _error)
-            self._write_error(_msg)
 
         try:
             os.remove(_filename)
-        except IOError:
+        except (IOError, OSError):
             pass
 
         return _ret, _output, _error
 
+    def _write_code_error(self, name, code, error):
+        _msg = _('Name "%s"\n') % name
+        _msg += _('Code "%s" with error: %s') % (
+            code.replace('\r', '').strip(),
+            error
+        )
+        self._write_error(_msg)
+
     def _eval_attributes(self, properties):
         _response = {
             'computer': {
@@ -265,9 +335,22 @@ class MigasFreeClient(MigasFreeCommand):
 
         # properties converted in attributes
         self._send_message(_('Evaluating attributes...'))
-        for _item in properties:
-            _ret, _response['attributes'][_item['name']], _error = \
-                self._eval_code(_item['name'], _item['language'], _item['code'])
+        _results = utils.parallel_map(
+            lambda _item: self._run_code(
+                _item['name'],
+                _item['language'],
+                _item['code'],
+                timeout=self.migas_properties_timeout
+            ),
+            properties,
+            workers=self.migas_properties_workers
+        )
+        # results are reported in server order
+        for _item, _result in zip(properties, _results):
+            _ret, _response['attributes'][_item['name']], _error = _result
+            if _ret != 0:
+                self._write_code_error(_item['name'], _item['code'], _error)
+
             _info = '{0}: {1}'.format(
                 _item['name'],
                 _response['attributes'][_item['name']]
@@ -284,15 +367,42 @@ class MigasFreeClient(MigasFreeCommand):
 
         return _response
 
+    @timing.traced('phase')
     def _eval_faults(self, fault_definitions):
         _response = {
             'faults': {}
         }
 
+        # all faults share the same time budget
+        _deadline = time.time() + self.migas_faults_timeout
+
+        def _eval_fault(item):
+            _timeout = min(self.FAULT_TIMEOUT, _deadline - time.time())
+            if _timeout <= 0:
+                return None  # budget expired before start
+
+            return self._run_code(
+                item['name'],
+                item['language'],
+                item['code'],
+                timeout=_timeout
+            )
+
         # evaluate faults
         self._send_message(_('Executing faults...'))
-        for _item in fault_definitions:
-            _ret, _result, _error = self._eval_code(_item['name'], _item['language'], _item['code'])
+        _results = utils.parallel_map(
+            _eval_fault,
+            fault_definitions,
+            workers=self.migas_properties_workers
+        )
+        for _item, _result in zip(fault_definitions, _results):
+            if _result is None:
+                _msg = _('%s: faults evaluation expired timeout') % _item['name']
+                self.operation_failed(_msg)
+                self._write_error(_msg)
+                continue
+
+            _ret, _result, _error = _result
             _info = '{0}: {1}'.format(_item['name'], _result)
             if _ret == 0:
                 if _result:
@@ -302,10 +412,15 @@ class MigasFreeClient(MigasFreeCommand):
                 else:
                     self.operation_ok(_info)
             else:
+                self._write_code_error(_item['name'], _item['code'], _error)
                 self.operation_failed('{0}: {1}'.format(_item['name'], _error))
 
+        if self._sync_stats:
+            self._sync_stats['faults'] = len(_response['faults'])
+
         return _response
 
+    @timing.traced('phase')
     def _get_attributes(self):
         """
         get properties and returns attributes to send
@@ -325,6 +440,7 @@ class MigasFreeClient(MigasFreeCommand):
 
         return _attributes
 
+    @timing.traced('phase')
     def _software_inventory(self):
         # actual software
         _software_before = self.pms.query_all()
@@ -363,6 +479,102 @@ class MigasFreeClient(MigasFreeCommand):
 
         return _software_before
 
+    @timing.traced('phase')
+    def _upload_software_base(self, software):
+        """
+        only changes since last acknowledged base are sent (with its version)
+        full base is sent if there is no version or server rejects the delta
+        """
+        _state = cache.load('software_reference', {})
+
+        if _state.get('version') is not None and 'inventory' in _state:
+            _diff_software = utils.compare_lists(_state['inventory'], software)
+            if not _diff_software:
+                logging.debug('Software base not changed')
+                return
+
+            _ret = self._url_request.run(
+                'upload_computer_software_base_delta',
+                data={
+                    'version': _state['version'],
+                    'delta': '\n'.join(_diff_software)
+                },
+                exit_on_error=False
+            )
+            if isinstance(_ret, dict) and 'version' in _ret:
+                cache.save('software_reference', {
+                    'version': _ret['version'],
+                    'inventory': software
+                })
+                return
+
+            logging.info('Software base delta not accepted: %s', _ret)
+
+        _ret = self._url_request.run(
+            'upload_computer_software_base',
+            data='\n'.join(software)
+        )
+        cache.save('software_reference', {
+            'version': _ret.get('version') if isinstance(_ret, dict) else None,
+            'inventory': software
+        })
+
+    def _get_software_base(self, state):
+        """
+        returns (software base, hash)
+        last base hash is sent, so server can reply {'unchanged': true}
+        """
+        _response = self._url_request.run(
+            'get_computer_software',
+            data={'hash': state.get('hash', '')}
+        )
+
+        if isinstance(_response, dict):
+            if _response.get('unchanged') and 'base' in state:
+                logging.debug('Software base unchanged')
+                return state['base'], state['hash']
+
+            logging.error('Unexpected software base: %s', _response)
+            return None, None
+
+        return _response, utils.sha1sum(_response)
+
+    @timing.traced('phase')
+    def _upload_software_base_diff(self, software):
+        _state = cache.load('software_base', {})
+
+        _software_base, _base_hash = self._get_software_base(_state)
+        if _software_base is None:
+            self.operation_failed()
+            return
+
+        _inventory_hash = utils.sha1sum('\n'.join(software))
+        if _base_hash == _state.get('hash') \
+                and _inventory_hash == _state.get('inventory_hash'):
+            logging.debug('Software base diff already uploaded')
+            self.operation_ok()
+            return
+
+        logging.debug('Software base: %s', _software_base)
+        _diff_software = utils.compare_lists(
+            _software_base.split('\n'),
+            software
+        )
+        _diff_software = '\n'.join(_diff_software)
+        logging.debug('Software base diff: %s', _diff_software)
+        self._url_request.run(
+            'upload_computer_software_base_diff',
+            data=_diff_software
+        )
+        self.operation_ok()
+
+        cache.save('software_base', {
+            'hash': _base_hash,
+            'base': _software_base,
+            'inventory_hash': _inventory_hash
+        })
+
+    @timing.traced('phase')
     def _upload_old_errors(self):
         """
         if there are old errors, upload them to server
@@ -388,7 +600,8 @@ class MigasFreeClient(MigasFreeCommand):
             ),
             proxy=self.migas_proxy,
             cert=self.migas_ssl_cert,
-            post=[('post', 'post'), ]  # dummy data
+            post=[('post', 'post'), ],  # dummy data
+            session=self._http_session
         )
 
         _curl.run()
@@ -417,7 +630,8 @@ class MigasFreeClient(MigasFreeCommand):
             ),
             proxy=self.migas_proxy,
             cert=self.migas_ssl_cert,
-            post=[('post', 'post'), ]  # dummy data
+            post=[('post', 'post'), ],  # dummy data
+            session=self._http_session
         )
         _curl.run()
 
@@ -431,22 +645,38 @@ class MigasFreeClient(MigasFreeCommand):
 
         return _response
 
+    @timing.traced('phase')
     def _create_repositories(self, repos):
         self._send_message(_('Creating repositories...'))
 
         _server = self.migas_server
-        if self.migas_package_proxy_cache:
+        _protocol = 'https' if self.migas_ssl_cert else 'http'
+        _template = self._get_repositories_url_template()
+
+        if self.config.peer_cache_port \
+                and peercache.is_running(self.config.peer_cache_port):
+            # agent peer cache goes to server (or package proxy cache)
+            _server = '127.0.0.1:{0}/{1}'.format(
+                self.config.peer_cache_port, _server
+            )
+            _protocol = 'http'
+            _template = _template.replace('https://', 'http://', 1)
+        elif self.migas_package_proxy_cache:
             _server = '{0}/{1}'.format(self.migas_package_proxy_cache, _server)
-
         _ret = self.pms.create_repos(
-            'https' if self.migas_ssl_cert else 'http',
+            _protocol,
             _server,
             self.migas_project,
             repos,
-            self._get_repositories_url_template()
+            _template
         )
 
         if _ret:
+            self._repos_fingerprint = self._get_repositories_fingerprint(
+                self.pms.render_repos(
+                    _protocol, _server, self.migas_project, repos, _template
+                )
+            )
             self.operation_ok()
         else:
             self._pms_status_ok = False
@@ -455,21 +685,130 @@ class MigasFreeClient(MigasFreeCommand):
             logging.error(_msg)
             self._write_error(_msg)
 
-    def _clean_pms_cache(self):
+    def _get_metadata_timestamp(self, url):
+        _curl = curl.Curl(
+            url,
+            proxy=self.migas_proxy,
+            cert=self.migas_ssl_cert,
+            session=self._http_session,
+            head=True
+        )
+        _curl.run()
+        if _curl.error or _curl.http_code != 200:
+            return None
+
+        _last_modified = _curl.get_header('Last-Modified')
+        _etag = _curl.get_header('ETag')
+        if not _last_modified and not _etag:
+            return None  # changes can not be detected
+
+        return '{0} {1}'.format(_last_modified, _etag)
+
+    def _get_repositories_fingerprint(self, content):
         """
-        clean cache of Package Management System
+        string _get_repositories_fingerprint(string content)
+        changes if repositories file, repositories key or
+        remote metadata (Release, repomd.xml) change
+        returns None if remote metadata state is unknown
         """
-        self._send_message(_('Getting repositories metadata...'))
-        _ret = self.pms.clean_all()
+        _state = [content]
 
-        if _ret:
+        _key_file = os.path.join(
+            settings.KEYS_PATH, self.migas_server, self.REPOS_KEY
+        )
+        if os.path.isfile(_key_file):
+            with open(_key_file, 'rb') as _fp:
+                _state.append(utils.sha1sum(_fp.read()))
+
+        for _url in self.pms.metadata_urls(content):
+            _timestamp = self._get_metadata_timestamp(_url)
+            if _timestamp is None:
+                logging.debug('Metadata state unknown: %s', _url)
+                return None
+
+            _state.append('{0} {1}'.format(_url, _timestamp))
+
+        logging.debug('Repositories state: %s', _state)
+
+        return utils.sha1sum('\n'.join(_state))
+
+    @timing.traced('phase')
+    def _update_metadata(self, force=False):
+        """
+        repositories metadata is refreshed (incrementally) only if
+        repositories fingerprint has changed since last refresh
+        """
+        _cached = cache.load('repositories', {})
+        if not force and self._repos_fingerprint \
+                and _cached.get('fingerprint') == self._repos_fingerprint \
+                and time.time() < _cached.get('refreshed', 0) + self.METADATA_MAX_AGE:
+            logging.info('Repositories unchanged, metadata is up to date')
+            return
+
+        self._send_message(_('Getting repositories metadata...'))
+        if self.pms.refresh_metadata():
             self.operation_ok()
+            cache.save('repositories', {
+                'fingerprint': self._repos_fingerprint,
+                'refreshed': time.time()
+            })
         else:
+            cache.remove('repositories')
             _msg = _('Error getting repositories metadata')
             self.operation_failed(_msg)
             logging.error(_msg)
             self._write_error(_msg)
 
+    @timing.traced('phase')
+    def _prune_pms_cache(self):
+        """
+        downloaded packages are kept between synchronizations
+        (retried upgrades do not download them again) within a budget
+        """
+        _freed = self.pms.prune_cache(
+            max_size=self.config.package_cache_max_size * 1024 * 1024,
+            max_age=self.config.package_cache_max_age * 24 * 60 * 60
+        )
+        if _freed:
+            logging.info('Package cache: %d bytes freed', _freed)
+
+    @timing.traced('phase')
+    def _prefetch_packages(self, remove, install, upgrade):
+        _ret, _error = self.pms.prefetch(remove, install, upgrade)
+        if not _ret:
+            # not fatal: remaining archives are downloaded while installing
+            logging.warning('Error prefetching packages: %s', _error)
+
+    def _start_prefetch(self, packages):
+        """
+        archives of the whole transaction are downloaded in background
+        while faults are uploaded and hardware is captured
+        (no PMS commands run meanwhile)
+        """
+
+        def _run():
+            try:
+                self._prefetch_packages(
+                    list(packages['remove']),
+                    list(packages['install']),
+                    self.migas_auto_update_packages is True
+                )
+            except (Exception, SystemExit):  # thread must not exit program
+                logging.exception('Error prefetching packages')
+
+        _thread = threading.Thread(target=_run, name='prefetch')
+        _thread.daemon = True
+        _thread.start()
+
+        return _thread
+
+    @timing.traced('phase')
+    def _wait_prefetch(self, thread):
+        self._send_message(_('Downloading packages...'))
+        thread.join()
+        self.operation_ok()
+
+    @timing.traced('phase')
     def _uninstall_packages(self, packages):
         self._send_message(_('Uninstalling packages...'))
         _ret, _error = self.pms.remove_silent(packages)
@@ -482,6 +821,7 @@ class MigasFreeClient(MigasFreeCommand):
             logging.error(_msg)
             self._write_error(_msg)
 
+    @timing.traced('phase')
     def _install_mandatory_packages(self, packages):
         self._send_message(_('Installing mandatory packages...'))
         _ret, _error = self.pms.install_silent(packages)
@@ -496,20 +836,31 @@ class MigasFreeClient(MigasFreeCommand):
 
         return _ret
 
-    def _update_packages(self):
-        self._send_message(_('Updating packages...'))
-        _ret, _error = self.pms.update_silent()
+    @timing.traced('phase')
+    def _sync_packages(self, packages):
+        """
+        removes, installs and updates (if auto update is enabled)
+        packages in one transaction
+        """
+
+        self._send_message(_('Synchronizing packages...'))
+        _ret, _error = self.pms.transaction(
+            packages['remove'],
+            packages['install'],
+            upgrade=self.migas_auto_update_packages is True
+        )
         if _ret:
             self.operation_ok()
         else:
             self._pms_status_ok = False
-            _msg = _('Error updating packages: %s') % _error
+            _msg = _('Error synchronizing packages: %s') % _error
             self.operation_failed(_msg)
             logging.error(_msg)
             self._write_error(_msg)
 
         return _ret
 
+    @timing.traced('phase')
     def _update_hardware_inventory(self):
         _hardware = json.loads('{}')  # default value
 
@@ -550,7 +901,10 @@ class MigasFreeClient(MigasFreeCommand):
             logging.error(_msg)
             self._write_error(_msg)
 
+    @timing.traced('phase')
     def _upload_execution_errors(self):
+        self._flush_messages()  # message errors are written too
+
         self._error_file_descriptor.close()
         self._error_file_descriptor = None
 
@@ -566,11 +920,20 @@ class MigasFreeClient(MigasFreeCommand):
             if not self._debug:
                 os.remove(self.ERROR_FILE)
 
+    @timing.traced('phase')
     def _update_system(self):
+        self._sync_stats = {
+            'faults': 0,
+            'errors': 0,
+            'packages_installed': 0,
+            'packages_removed': 0,
+            'packages_upgraded': 0,
+        }
+
         if not self._check_sign_keys():
             sys.exit(errno.EPERM)
 
-        if self._send_message(_('Connecting to migasfree server...')):
+        if self._send_message(_('Connecting to migasfree server...'), wait=True):
             self.operation_ok()
         else:
             sys.exit(errno.EBADRQC)
@@ -588,34 +951,57 @@ class MigasFreeClient(MigasFreeCommand):
         )
         self.operation_ok()
         logging.debug('Server response: %s', _request)
+        self._sync_hint = utils.cast_to_int(
+            _request.get('next_sync_after'), default=None
+        )
 
+        # fault scripts and inventory query the PMS:
+        # they run before any PMS command (which takes PMS lock)
+        _faults = None
         if len(_request['faultsdef']) > 0:
-            _response = self._eval_faults(_request['faultsdef'])
-            logging.debug('Faults to send: %s', _response)
-
-            self._send_message(_('Uploading faults...'))
-            _request_faults = self._url_request.run(
-                'upload_computer_faults',
-                data=_response
-            )
-            self.operation_ok()
-            logging.debug('Server response: %s', _request_faults)
+            _faults = self._eval_faults(_request['faultsdef'])
+            logging.debug('Faults to send: %s', _faults)
 
         _software_before = self._software_inventory()
 
         self._create_repositories(_request['repositories'])
 
-        self._clean_pms_cache()
+        self._update_metadata()
+
+        # downloads overlap with faults upload and hardware capture
+        # (neither of them runs PMS commands)
+        _prefetch = self._start_prefetch(_request['packages'])
+        try:
+            if _faults is not None:
+                self._send_message(_('Uploading faults...'))
+                _request_faults = self._url_request.run(
+                    'upload_computer_faults',
+                    data=_faults
+                )
+                self.operation_ok()
+                logging.debug('Server response: %s', _request_faults)
+
+            if _request.get('hardware_capture') is True:
+                self._update_hardware_inventory()
+        finally:
+            # installation starts when all archives are present
+            # (and exit never leaves a PMS process running)
+            self._wait_prefetch(_prefetch)
+
+        self._sync_packages(_request['packages'])
 
-        self._uninstall_packages(_request['packages']['remove'])
-        self._install_mandatory_packages(_request['packages']['install'])
-        if self.migas_auto_update_packages is True:
-            self._update_packages()
+        self._prune_pms_cache()
 
         # upload computer software history
         _software_after = self.pms.query_all()
         utils.write_file(settings.SOFTWARE_FILE, '\n'.join(_software_after))
         _diff_software = utils.compare_lists(_software_before, _software_after)
+        _installed, _removed, _upgraded = self.pms.changes(
+            _software_before, _software_after
+        )
+        self._sync_stats['packages_installed'] = len(_installed)
+        self._sync_stats['packages_removed'] = len(_removed)
+        self._sync_stats['packages_upgraded'] = len(_upgraded)
         if _diff_software:
             self._send_message(_('Uploading software history...'))
             _data = time.strftime('# %Y-%m-%d %H:%M:%S\n', time.localtime()) \
@@ -631,27 +1017,10 @@ class MigasFreeClient(MigasFreeCommand):
         self._send_message(_('Uploading software inventory...'))
         if _request['base']:
             logging.info('This computer is software reference')
-            self._url_request.run(
-                'upload_computer_software_base',
-                data='\n'.join(_software_after)
-            )
+            self._upload_software_base(_software_after)
             self.operation_ok()
 
-        _software_base = self._url_request.run('get_computer_software')
-        _software_base = _software_base.split('\n')
-        logging.debug('Software base: %s', _software_base)
-
-        _diff_software = utils.compare_lists(_software_base, _software_after)
-        _diff_software = '\n'.join(_diff_software)
-        logging.debug('Software base diff: %s', _diff_software)
-        self._url_request.run(
-            'upload_computer_software_base_diff',
-            data=_diff_software
-        )
-        self.operation_ok()
-
-        if _request.get('hardware_capture') is True:
-            self._update_hardware_inventory()
+        self._upload_software_base_diff(_software_after)
 
         # remove and install devices (new in server 4.2) (issue #31)
         if 'devices' in _request:
@@ -739,6 +1108,7 @@ class MigasFreeClient(MigasFreeCommand):
 
         return _ret
 
+    @timing.traced('phase')
     def _install_devices(self, devices):
         self._check_sign_keys()
 
@@ -775,6 +1145,7 @@ class MigasFreeClient(MigasFreeCommand):
 
         return _ret
 
+    @timing.traced('phase')
     def _remove_devices(self, devices):
         self._check_sign_keys()
 
@@ -787,6 +1158,7 @@ class MigasFreeClient(MigasFreeCommand):
 
         return _removed_ids
 
+    @timing.traced('phase')
     def _sync_logical_devices(self, devices):
         """
         Synchronize logical devices (since migasfree-server >= 4.13)
@@ -896,6 +1268,126 @@ class MigasFreeClient(MigasFreeCommand):
                     logging.error(_msg)
                     self._write_error(_msg)
 
+    def _scheduler(self):
+        return scheduler.Scheduler(
+            interval=max(self.config.agent_interval, 60),
+            jitter=self.config.agent_jitter,
+            backoff_max=self.config.sync_backoff_max
+        )
+
+    def _record_sync(self):
+        """
+        server status at the end of a synchronization is recorded in
+        scheduler (backoff while server is overloaded, short retry while
+        it is unreachable)
+        """
+        if self._url_request.last_http_code is None:
+            return  # server not contacted
+
+        _scheduler = self._scheduler()
+        if scheduler.is_overloaded(self._url_request.last_http_code):
+            _scheduler.failed(self._url_request.retry_after)
+        elif scheduler.is_unreachable(self._url_request.last_http_code):
+            _scheduler.unreachable()
+        else:
+            _scheduler.succeeded(self._sync_hint)
+
+    def _wait_for_schedule(self):
+        """
+        unattended synchronizations (without terminal) respect server
+        backoff and wait a random splay before contacting server
+        """
+        if sys.stdin and sys.stdin.isatty():
+            return
+
+        _scheduler = self._scheduler()
+        _deferred = _scheduler.deferred()
+        if _deferred:
+            _msg = _('Synchronization deferred (%d seconds left)') % _deferred
+            print(_msg)
+            logging.info(_msg)
+            sys.exit(os.EX_OK)
+
+        _splay = _scheduler.splay(self.config.sync_splay)
+        if _splay:
+            print(_('Waiting %d seconds before synchronization') % _splay)
+            time.sleep(_splay)
+
+    def _save_metrics(self, ret):
+        _spans = timing.instance().report()['spans']
+        _phases = collections.OrderedDict()
+        _duration = 0
+        for _span in _spans:
+            if _span['kind'] != 'phase':
+                continue
+
+            if _span['name'] == 'update_system':
+                _duration = _span['wall']
+            else:
+                _phases[_span['name']] = round(
+                    _phases.get(_span['name'], 0) + _span['wall'], 3
+                )
+
+        _run = dict(self._sync_stats)
+        _run.update({
+            'exit_code': ret,
+            'sync_duration_seconds': _duration,
+            'phase_duration_seconds': [
+                ({'phase': _name}, _value) for _name, _value in _phases.items()
+            ],
+            'http_retries': timing.instance().counters['http_retries'],
+        })
+
+        if self.config.metrics_file:
+            metrics.write(self.config.metrics_file, _run)
+
+    def _finish_sync(self, ret, profile=False):
+        """
+        void _finish_sync(int ret, bool profile=False)
+        ret: exit code of synchronization
+        """
+        self._record_sync()
+        self._save_metrics(ret)
+        self._save_timing(profile)
+
+    def _save_timing(self, profile=False):
+        """
+        timing report of last synchronization is written in TIMING_FILE,
+        uploaded to server (if Upload_Timing) and printed (if profile)
+        """
+        _tracer = timing.instance()
+        _tracer.save(settings.TIMING_FILE)
+
+        if profile:
+            print('')
+            print(_tracer.format())
+
+        if self.config.upload_timing:
+            try:
+                self._url_request.run(
+                    'upload_computer_timing',
+                    data=_tracer.report(),
+                    exit_on_error=False
+                )
+            except SystemExit:
+                logging.error('Timing report not uploaded')
+
+        _tracer.reset()
+
+    def _delegate_to_agent(self, force_upgrade=False):
+        """
+        if migasfree-agent is running, it synchronizes the computer
+        (with its warm state) and this process exits with its result
+        """
+        from .agent import trigger
+
+        _ret = trigger(force_upgrade)
+        if _ret is None:
+            return
+
+        print(_('System updated by migasfree-agent (see %s)') % settings.LOG_FILE)
+        sys.exit(_ret)
+
     def run(self):
         _program = 'migasfree client'
         parser = optparse.OptionParser(
@@ -952,6 +1444,16 @@ class MigasFreeClient(MigasFreeCommand):
             help=_('Force package upgrades')
         )
 
+        parser.add_option(
+            "--profile", action="store_true",
+            help=_('Show timing of synchronization phases')
+        )
+
+        parser.add_option(
+            "--refresh-identity", action="store_true",
+            help=_('Read hardware identity again (UUID, SMBIOS, MAC)')
+        )
+
         options, arguments = parser.parse_args()
 
         # check restrictions
@@ -980,13 +1482,28 @@ class MigasFreeClient(MigasFreeCommand):
         if options.force_upgrade:
             self.migas_auto_update_packages = True
 
+        if options.refresh_identity:
+            utils.refresh_identity()
+
+        if options.update:
+            self._wait_for_schedule()
+            self._delegate_to_agent(options.force_upgrade)
+
         utils.check_lock_file(self.CMD, self.LOCK_FILE)
 
         self._show_running_options()
 
         # actions dispatcher
         if options.update:
-            self._update_system()
+            _ret = errno.EIO  # unexpected error
+            try:
+                self._update_system()
+                _ret = os.EX_OK if self._pms_status_ok else errno.EPROTO
+            except SystemExit as e:
+                _ret = e.code if isinstance(e.code, int) else errno.EPERM
+                raise
+            finally:
+                self._finish_sync(_ret, options.profile)
         elif options.register:
             self._register_computer(options.user)
         elif options.search:
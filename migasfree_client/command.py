@@ -17,19 +17,26 @@
 
 import os
 import sys
+import atexit
 import logging
 import errno
 import getpass
 import platform
 import pwd
 import ssl
+import time
+import hashlib
 
 from . import (
     settings,
     utils,
+    cache,
+    config,
     url_request,
     printcolor,
-    curl
+    curl,
+    timing,
+    secure,
 )
 
 from .backends import Pms
@@ -66,14 +73,23 @@ class MigasFreeCommand(object):
     PRIVATE_KEY = ''
     REPOS_KEY = 'repositories.pub'
 
+    SSL_CERT_RENEW_BEFORE = 7 * 24 * 60 * 60  # seconds before expiry
+    SSL_CERT_MAX_AGE = 7 * 24 * 60 * 60  # if expiry is unknown
+
     ICON = 'apps/migasfree.svg'
     ICON_COMPLETED = 'actions/migasfree-ok.svg'
 
     _url_request = None
+    _http_session = None
 
     _debug = False
 
-    pms = None
+    _pms = None
+    PMS_LIST = [  # search order
+        ('apt-get', 'Apt'),
+        ('yum', 'Yum'),
+        ('zypper', 'Zypper'),
+    ]
 
     auto_register_user = ''
     auto_register_password = ''
@@ -83,98 +99,11 @@ class MigasFreeCommand(object):
     def __init__(self):
         _log_level = logging.INFO
 
-        _config_client = utils.get_config(settings.CONF_FILE, 'client')
-        if not isinstance(_config_client, dict):
-            _config_client = {}
-
-        self.migas_project = os.environ.get(
-            'MIGASFREE_CLIENT_PROJECT',
-            os.environ.get(
-                'MIGASFREE_CLIENT_VERSION',  # backwards compatibility
-                utils.get_mfc_project()
-            )
-        )
-
-        self.PRIVATE_KEY = '{0}.pri'.format(self.migas_project)
-
-        self.migas_computer_name = os.environ.get(
-            'MIGASFREE_CLIENT_COMPUTER_NAME', utils.get_mfc_computer_name()
-        )
-
-        self.migas_server = os.environ.get(
-            'MIGASFREE_CLIENT_SERVER',
-            _config_client.get('server', 'localhost')
-        )
-
-        self.migas_auto_update_packages = utils.cast_to_bool(
-            os.environ.get(
-                'MIGASFREE_CLIENT_AUTO_UPDATE_PACKAGES',
-                _config_client.get('auto_update_packages', True)
-            ),
-            default=True
-        )
-
-        self.migas_manage_devices = utils.cast_to_bool(
-            os.environ.get(
-                'MIGASFREE_CLIENT_MANAGE_DEVICES',
-                _config_client.get('manage_devices', True)
-            ),
-            default=True
-        )
-
-        self.migas_proxy = os.environ.get(
-            'MIGASFREE_CLIENT_PROXY', _config_client.get('proxy', None)
-        )
-        self.migas_package_proxy_cache = os.environ.get(
-            'MIGASFREE_CLIENT_PACKAGE_PROXY_CACHE',
-            _config_client.get('package_proxy_cache', None)
-        )
-
-        self.migas_gui_verbose = utils.cast_to_bool(
-            os.environ.get(
-                'MIGASFREE_CLIENT_GUI_VERBOSE',
-                _config_client.get('gui_verbose', True)
-            ),
-            default=True
-        )
-
-        self._debug = utils.cast_to_bool(
-            os.environ.get(
-                'MIGASFREE_CLIENT_DEBUG',
-                _config_client.get('debug', False)
-            )
-        )
+        self.config = config.instance()
+        self._read_config()
         if self._debug:
             _log_level = logging.DEBUG
 
-        _config_packager = utils.get_config(settings.CONF_FILE, 'packager')
-        if not isinstance(_config_packager, dict):
-            _config_packager = {}
-
-        self.packager_user = os.environ.get(
-            'MIGASFREE_PACKAGER_USER', _config_packager.get('user', None)
-        )
-        self.packager_pwd = os.environ.get(
-            'MIGASFREE_PACKAGER_PASSWORD',
-            _config_packager.get('password', None)
-        )
-        self.packager_project = os.environ.get(
-            'MIGASFREE_PACKAGER_PROJECT',
-            os.environ.get(
-                'MIGASFREE_PACKAGER_VERSION',  # backwards compatibility
-                _config_packager.get(
-                    'project',
-                    _config_packager.get(
-                        'version',  # backwards compatibility
-                        None
-                    )
-                )
-            )
-        )
-        self.packager_store = os.environ.get(
-            'MIGASFREE_PACKAGER_STORE', _config_packager.get('store', None)
-        )
-
         # http://www.lightbird.net/py-by-example/logging.html
         logging.basicConfig(
             format='%(asctime)s - %(levelname)s - %(module)s - %(funcName)s - %(message)s',
@@ -184,28 +113,133 @@ class MigasFreeCommand(object):
         logging.info('*' * 20)
         logging.info('%s in execution', self.CMD)
         logging.info('Config file: %s', settings.CONF_FILE)
-        logging.debug('Config client: %s', _config_client)
-        logging.debug('Config packager: %s', _config_packager)
+        logging.debug('Config client: %s', self.config.get('client'))
+        logging.debug('Config packager: %s', self.config.get('packager'))
+
+        self._http_session = curl.Session()
+        atexit.register(self._close_session)
 
         self._ssl_cert()
-        self._pms_selection()
         self._init_url_request()
 
-    def _ssl_cert(self):
+    def _close_session(self):
+        if self._http_session is not None:
+            self._http_session.close()
+            self._http_session = None
+
+    def _read_config(self):
+        self.migas_project = self.config.project
+        self.PRIVATE_KEY = '{0}.pri'.format(self.migas_project)
+
+        self.migas_computer_name = self.config.computer_name
+        self.migas_server = self.config.server
+        self.migas_auto_update_packages = self.config.auto_update_packages
+        self.migas_manage_devices = self.config.manage_devices
+        self.migas_proxy = self.config.proxy
+        self.migas_package_proxy_cache = self.config.package_proxy_cache
+        self.migas_gui_verbose = self.config.gui_verbose
+        self.migas_properties_workers = self.config.properties_workers
+        self.migas_properties_timeout = self.config.properties_timeout
+        self.migas_faults_timeout = self.config.faults_timeout
+        self._debug = self.config.debug
+
+        self.packager_user = self.config.packager_user
+        self.packager_pwd = self.config.packager_password
+        self.packager_project = self.config.packager_project
+        self.packager_store = self.config.packager_store
+
+    def _cert_file(self):
+        """
+        string _cert_file(void)
+        non root commands (migasfree-upload) can not write in cache directory
+        """
+
+        _path = settings.CACHE_PATH
+        if not self._check_user_is_root():
+            _path = os.path.join(
+                os.path.expanduser('~'), '.cache', 'migasfree-client'
+            )
+
+        return os.path.join(_path, '{0}.pem'.format(self.migas_server))
+
+    def _is_cached_cert_valid(self, cached, cert_file):
+        if not os.path.isfile(cert_file):
+            return False
+
+        if not cached or cached.get('file') != cert_file:
+            # no metadata (non root commands): taken from file
+            cached = {
+                'expiry': secure.cert_expiry(cert_file),
+                'fetched': os.path.getmtime(cert_file)
+            }
+
+        _now = time.time()
+        if cached.get('expiry'):
+            return _now < cached['expiry'] - self.SSL_CERT_RENEW_BEFORE
+
+        return _now < cached.get('fetched', 0) + self.SSL_CERT_MAX_AGE
+
+    def _ssl_cert(self, refresh=False):
+        """
+        bool _ssl_cert(bool refresh=False)
+        server certificate is cached until it is close to expiry
+        or it fails verification (refresh)
+        returns True if a new certificate has been fetched
+        (if it can not be fetched, previous one is kept)
+        """
+
+        _certs = cache.load('ssl_certs', {})
+        _cached = _certs.get(self.migas_server)
+        _cert_file = self._cert_file()
+        if not refresh and self._is_cached_cert_valid(_cached, _cert_file):
+            self.migas_ssl_cert = _cert_file
+            return False
+
         address = self.migas_server.split(':')
         host = address[0]
         port = int(address[1]) if len(address) == 2 else 80
 
-        if os.path.isfile(settings.CERT_FILE):
-            os.remove(settings.CERT_FILE)
-
-        self.migas_ssl_cert = None
         try:
             cert = ssl.get_server_certificate((host, port), ssl.PROTOCOL_SSLv23)
-            if utils.write_file(settings.CERT_FILE, cert):
-                self.migas_ssl_cert = settings.CERT_FILE
-        except:
-            pass
+        except Exception as e:
+            logging.warning('Server certificate not available: %s', e)
+            cert = None
+
+        # previous certificate is only replaced by a new one (failures are not cached)
+        if cert is None or not utils.write_file_atomically(_cert_file, cert):
+            self.migas_ssl_cert = _cert_file if os.path.isfile(_cert_file) else None
+            return False
+
+        self.migas_ssl_cert = _cert_file
+        _info = {
+            'file': _cert_file,
+            'fetched': time.time(),
+            'expiry': secure.cert_expiry(_cert_file),
+            'fingerprint': hashlib.sha256(
+                ssl.PEM_cert_to_DER_cert(cert)
+            ).hexdigest()
+        }
+
+        if _cached and _cached.get('fingerprint') != _info['fingerprint']:
+            logging.info('Server certificate changed: %s', _info['fingerprint'])
+
+        if self._check_user_is_root():
+            _certs[self.migas_server] = _info
+            cache.save('ssl_certs', _certs)
+
+        return True
+
+    def _refresh_ssl_cert(self):
+        """
+        string _refresh_ssl_cert(void)
+        returns new certificate or None if it can not be fetched
+        """
+
+        logging.warning('Refreshing server certificate')
+        if not self._ssl_cert(refresh=True):
+            return None
+
+        return self.migas_ssl_cert
 
     def _init_url_request(self):
         _url_base = '{0}/api/'.format(self.migas_server)
@@ -222,7 +256,9 @@ class MigasFreeCommand(object):
                 'private': self.PRIVATE_KEY,
                 'public': self.PUBLIC_KEY
             },
-            cert=self.migas_ssl_cert
+            cert=self.migas_ssl_cert,
+            session=self._http_session,
+            cert_handler=self._refresh_ssl_cert
         )
 
     def _check_path(self, path):
@@ -237,6 +273,7 @@ class MigasFreeCommand(object):
 
         return True
 
+    @timing.traced('phase')
     def _execute_path(self, path):
         self._check_path(path)
         files = os.listdir(path)
@@ -354,6 +391,7 @@ class MigasFreeCommand(object):
             ),
             proxy=self.migas_proxy,
             cert=self.migas_ssl_cert,
+            session=self._http_session,
         )
         _curl.run()
 
@@ -431,38 +469,28 @@ class MigasFreeCommand(object):
         print('\t%s: %s' % (_('Debug'), self._debug))
         print('\t%s: %s' % (_('Computer name'), self.migas_computer_name))
         print('\t%s: %s' % (_('GUI verbose'), self.migas_gui_verbose))
-        print('\t%s: %s' % (_('PMS'), self.pms))
+        print('\t%s: %s' % (_('PMS'), self._pms or self._search_pms()))
         print('')
 
     def _usage_examples(self):
         raise NotImplementedError
 
     def _search_python(self):
-        _cmd = """
-_PYTHON=$(which python3)
-python3 -c "import migasfree_client" 2&> /dev/null
-if [ $? -ne 0 ]
-then
-    _PYTHON=$(which python2)
-fi
-echo $_PYTHON
-"""
-        _ret, _output, _ = utils.execute(_cmd, interactive=False)
-
-        return _output.strip() if _ret == 0 else 'python'
+        # running interpreter is able to import migasfree_client
+        return sys.executable or 'python'
 
     def _search_pms(self):
-        _pms_list = {
-            'apt-get': 'Apt',
-            'yum': 'Yum',
-            'zypper': 'Zypper',
-        }
-
-        for _item in _pms_list:
-            _cmd = 'which {0}'.format(_item)
-            _ret, _, _ = utils.execute(_cmd, interactive=False)
-            if _ret == 0:
-                return _pms_list[_item]
+        _cached = cache.load('pms', {})
+        if _cached.get('pms') in Pms._entities_ \
+                and _cached.get('path') \
+                and os.access(_cached['path'], os.X_OK):
+            return _cached['pms']
+
+        for _cmd, _pms in self.PMS_LIST:
+            _path = utils.which(_cmd)
+            if _path:
+                cache.save('pms', {'pms': _pms, 'path': _path})
+                return _pms
 
         return None  # if not found
 
@@ -473,7 +501,17 @@ echo $_PYTHON
             logging.critical('Any PMS was not found. Cannot continue.')
             sys.exit(errno.EINPROGRESS)
 
-        self.pms = Pms.factory(_pms_info)()
+        self._pms = timing.TracedObject(Pms.factory(_pms_info)(), 'pms')
+
+    @property
+    def pms(self):
+        """
+        PMS is only detected when it is needed
+        """
+        if self._pms is None:
+            self._pms_selection()
+
+        return self._pms
 
     def operation_ok(self, info=''):
         _msg = str(' ' + _('Ok')).rjust(38, '*')
@@ -0,0 +1,256 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Client configuration: config file is parsed once per process and
+MIGASFREE_CLIENT_* (MIGASFREE_PACKAGER_*) environment variables override it
+"""
+
+import os
+
+try:
+    import ConfigParser
+except ImportError:
+    import configparser as ConfigParser
+
+from . import settings, utils
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+__all__ = ('Config', 'instance')
+
+# attribute: (section, options, environment variables, type, default)
+# options and environment variables are searched in order
+# callable default values are evaluated only if needed
+FIELDS = {
+    'server': (
+        'client', ['server'], ['MIGASFREE_CLIENT_SERVER'], str, 'localhost'
+    ),
+    'project': (
+        'client',
+        ['project', 'version'],  # backwards compatibility
+        ['MIGASFREE_CLIENT_PROJECT', 'MIGASFREE_CLIENT_VERSION'],
+        str,
+        utils.get_distro_project
+    ),
+    'computer_name': (
+        'client', ['computer_name'], ['MIGASFREE_CLIENT_COMPUTER_NAME'],
+        str, utils.get_hostname
+    ),
+    'auto_update_packages': (
+        'client', ['auto_update_packages'],
+        ['MIGASFREE_CLIENT_AUTO_UPDATE_PACKAGES'], bool, True
+    ),
+    'manage_devices': (
+        'client', ['manage_devices'], ['MIGASFREE_CLIENT_MANAGE_DEVICES'],
+        bool, True
+    ),
+    'proxy': (
+        'client', ['proxy'], ['MIGASFREE_CLIENT_PROXY'], str, None
+    ),
+    'package_proxy_cache': (
+        'client', ['package_proxy_cache'],
+        ['MIGASFREE_CLIENT_PACKAGE_PROXY_CACHE'], str, None
+    ),
+    'gui_verbose': (
+        'client', ['gui_verbose'], ['MIGASFREE_CLIENT_GUI_VERBOSE'],
+        bool, True
+    ),
+    'properties_workers': (
+        'client', ['properties_workers'],
+        ['MIGASFREE_CLIENT_PROPERTIES_WORKERS'], int, 4
+    ),
+    'properties_timeout': (
+        'client', ['properties_timeout'],
+        ['MIGASFREE_CLIENT_PROPERTIES_TIMEOUT'], int, 60
+    ),
+    'faults_timeout': (
+        'client', ['faults_timeout'], ['MIGASFREE_CLIENT_FAULTS_TIMEOUT'],
+        int, 300
+    ),
+    'agent_interval': (
+        'client', ['agent_interval'], ['MIGASFREE_CLIENT_AGENT_INTERVAL'],
+        int, 3600
+    ),
+    'agent_jitter': (
+        'client', ['agent_jitter'], ['MIGASFREE_CLIENT_AGENT_JITTER'],
+        int, 600
+    ),
+    'sync_splay': (
+        'client', ['sync_splay'], ['MIGASFREE_CLIENT_SYNC_SPLAY'], int, 0
+    ),
+    'sync_backoff_max': (
+        'client', ['sync_backoff_max'], ['MIGASFREE_CLIENT_SYNC_BACKOFF_MAX'],
+        int, 21600
+    ),
+    'upload_timing': (
+        'client', ['upload_timing'], ['MIGASFREE_CLIENT_UPLOAD_TIMING'],
+        bool, False
+    ),
+    'metrics_file': (
+        'client', ['metrics_file'], ['MIGASFREE_CLIENT_METRICS_FILE'], str,
+        '/var/lib/prometheus/node-exporter/migasfree-client.prom'
+    ),
+    'package_cache_max_size': (
+        'client', ['package_cache_max_size'],
+        ['MIGASFREE_CLIENT_PACKAGE_CACHE_MAX_SIZE'], int, 1024
+    ),
+    'package_cache_max_age': (
+        'client', ['package_cache_max_age'],
+        ['MIGASFREE_CLIENT_PACKAGE_CACHE_MAX_AGE'], int, 30
+    ),
+    'peer_cache_port': (
+        'client', ['peer_cache_port'], ['MIGASFREE_CLIENT_PEER_CACHE_PORT'],
+        int, 0
+    ),
+    'peer_cache_address': (
+        'client', ['peer_cache_address'],
+        ['MIGASFREE_CLIENT_PEER_CACHE_ADDRESS'], str, ''
+    ),
+    'peer_cache_peers': (
+        'client', ['peer_cache_peers'], ['MIGASFREE_CLIENT_PEER_CACHE_PEERS'],
+        str, ''
+    ),
+    'peer_cache_max_size': (
+        'client', ['peer_cache_max_size'],
+        ['MIGASFREE_CLIENT_PEER_CACHE_MAX_SIZE'], int, 2048
+    ),
+    'debug': (
+        'client', ['debug'], ['MIGASFREE_CLIENT_DEBUG'], bool, False
+    ),
+    'packager_user': (
+        'packager', ['user'], ['MIGASFREE_PACKAGER_USER'], str, None
+    ),
+    'packager_password': (
+        'packager', ['password'], ['MIGASFREE_PACKAGER_PASSWORD'], str, None
+    ),
+    'packager_project': (
+        'packager',
+        ['project', 'version'],  # backwards compatibility
+        ['MIGASFREE_PACKAGER_PROJECT', 'MIGASFREE_PACKAGER_VERSION'],
+        str,
+        None
+    ),
+    'packager_store': (
+        'packager', ['store'], ['MIGASFREE_PACKAGER_STORE'], str, None
+    ),
+}
+
+
+class Config(object):
+    """
+    Typed configuration values are attributes (see FIELDS)
+    """
+
+    def __init__(self, filename=settings.CONF_FILE):
+        self.filename = filename
+        self.sections = {}  # raw config file values
+        self._signature = None
+
+        self.reload(force=True)
+
+    def _file_signature(self):
+        try:
+            _stat = os.stat(self.filename)
+        except OSError:
+            return None
+
+        return _stat.st_mtime, _stat.st_size
+
+    def _read(self):
+        self.sections = {}
+
+        if not os.path.isfile(self.filename):
+            return
+
+        try:
+            _parser = ConfigParser.RawConfigParser()
+            _parser.read(self.filename)
+            for _section in _parser.sections():
+                self.sections[_section] = dict(_parser.items(_section))
+        except ConfigParser.Error:
+            self.sections = {}
+
+    def _value(self, section, options, variables, type_, default):
+        _value = None
+        for _variable in variables:
+            if _variable in os.environ:
+                _value = os.environ[_variable]
+                break
+
+        if _value is None:
+            for _option in options:
+                if _option in self.sections.get(section, {}):
+                    _value = self.sections[section][_option]
+                    break
+
+        if callable(default):
+            if _value is not None:
+                return _value
+            default = default()
+
+        if type_ is bool:
+            return utils.cast_to_bool(_value, default=default)
+
+        if type_ is int:
+            return utils.cast_to_int(_value, default=default)
+
+        return default if _value is None else _value
+
+    def reload(self, force=False):
+        """
+        bool reload(bool force=False)
+        file is parsed again only if it has been modified
+        returns True if values have been read
+        """
+
+        _signature = self._file_signature()
+        if not force and _signature == self._signature:
+            return False
+
+        self._signature = _signature
+        self._read()
+
+        for _attribute, _field in FIELDS.items():
+            setattr(self, _attribute, self._value(*_field))
+
+        return True
+
+    def get(self, section):
+        """
+        dict get(string section)
+        raw values of a config file section
+        """
+
+        return dict(self.sections.get(section, {}))
+
+
+_instance = None
+
+
+def instance():
+    """
+    Config instance(void)
+    process-wide configuration
+    """
+
+    global _instance
+
+    if _instance is None:
+        _instance = Config()
+
+    return _instance
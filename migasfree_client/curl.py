@@ -40,12 +40,17 @@ __author__ = 'Jose Antonio Chavarría'
 
 import os
 import sys
+import threading
 try:
     import pycurl
 except ImportError:
     raise SystemExit('migasfree client requires PycURL 7.19 or later.')
 
-from . import utils
+from . import utils, timing
+
+# curl errors caused by server certificate
+# (SSL_CONNECT_ERROR, PEER_FAILED_VERIFICATION, SSL_CACERT, SSL_CACERT_BADFILE)
+SSL_ERRORS = [35, 51, 60, 77]
 
 
 class Storage(object):
@@ -68,6 +73,54 @@ class Storage(object):
         return self.contents
 
 
+class Session(object):
+    """
+    Keeps a reusable curl handle between requests, so TCP connections and
+    TLS sessions are not negotiated again for every call to the server.
+    DNS, cookies and SSL sessions are shared through a CurlShare object.
+    Handle is used by one request at a time (lock), several threads
+    (status messages) share the session.
+    """
+
+    def __init__(self):
+        self.share = pycurl.CurlShare()
+        for _data in ['LOCK_DATA_COOKIE', 'LOCK_DATA_DNS', 'LOCK_DATA_SSL_SESSION']:
+            if hasattr(pycurl, _data):  # depends on libcurl version
+                self.share.setopt(pycurl.SH_SHARE, getattr(pycurl, _data))
+
+        self._curl = None
+        self.lock = threading.RLock()
+
+    def handle(self):
+        """
+        pycurl.Curl handle(void)
+        returns the session handle with default options
+        (connection cache is preserved)
+        lock must be held while handle is used
+        """
+
+        if self._curl is None:
+            self._curl = pycurl.Curl()
+        else:
+            self._curl.unsetopt(pycurl.SHARE)  # reset keeps it attached
+            self._curl.reset()
+
+        self._curl.setopt(pycurl.SHARE, self.share)
+        self._curl.setopt(pycurl.COOKIEFILE, '')  # enables cookie engine
+
+        return self._curl
+
+    def close(self):
+        with self.lock:
+            if self._curl is not None:
+                self._curl.close()
+                self._curl = None
+
+            if self.share is not None:
+                self.share.close()
+                self.share = None
+
+
 class Curl(object):
     DEBUG = 0
 
@@ -78,12 +131,25 @@ class Curl(object):
         proxy='',
         accept_lang='en-US',
         cert=None,
-        timeout=0
+        timeout=0,
+        session=None,
+        head=False,
+        headers=None,
+        write=None,
+        connect_timeout=0
     ):
         self.url = url
         self.post = post
         self.proxy = proxy
         self.accept_lang = accept_lang
+        self.cert = cert
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.session = session
+        self.head = head
+        self.headers = headers or []  # extra request headers
+        # write: function(data) to process body as it arrives
+        self.write = write
 
         self.error = None
         self.errno = 0
@@ -95,20 +161,26 @@ class Curl(object):
         self.body = Storage()
         self.header = Storage()
 
-        self.curl = pycurl.Curl()
-        self.curl.setopt(pycurl.TIMEOUT, timeout)
-        self.curl.setopt(pycurl.WRITEFUNCTION, self.body.store)
+        self.curl = None  # handle while running
+
+    def _setup(self):
+        self.curl.setopt(pycurl.TIMEOUT, self.timeout)
+        if self.connect_timeout:
+            self.curl.setopt(pycurl.CONNECTTIMEOUT, self.connect_timeout)
+        self.curl.setopt(pycurl.WRITEFUNCTION, self.write or self.body.store)
         self.curl.setopt(pycurl.HEADERFUNCTION, self.header.store)
         self.curl.setopt(pycurl.FOLLOWLOCATION, 1)
         self.curl.setopt(pycurl.HTTPGET, 1)
+        if self.head:
+            self.curl.setopt(pycurl.NOBODY, 1)
 
         if self.url.startswith('https://'):  # server over SSL
             self.curl.setopt(pycurl.SSL_VERIFYPEER, 0)  # do not check the server's cert
             self.curl.setopt(pycurl.SSL_VERIFYHOST, 0)
 
             # Set certificate path and verifications
-            if cert is not None and os.path.exists(cert):
-                self.curl.setopt(pycurl.CAINFO, cert)
+            if self.cert is not None and os.path.exists(self.cert):
+                self.curl.setopt(pycurl.CAINFO, self.cert)
                 self.curl.setopt(pycurl.SSL_VERIFYPEER, 1)
                 self.curl.setopt(pycurl.SSL_VERIFYHOST, 2)
 
@@ -116,15 +188,53 @@ class Curl(object):
             self.curl.setopt(pycurl.VERBOSE, 1)
             self.curl.setopt(pycurl.DEBUGFUNCTION, self._test)
 
+    def get_header(self, name):
+        """
+        string get_header(string name)
+        value of a header in last response (None if not exists)
+        """
+
+        _value = None
+        for _line in str(self.header).splitlines():
+            if _line.startswith('HTTP/'):  # new response (redirections)
+                _value = None
+                continue
+
+            _name, _sep, _content = _line.partition(':')
+            if _sep and _name.strip().lower() == name.lower():
+                _value = _content.strip()
+
+        return _value
+
     def _test(self, debug_type, debug_msg):
         print('debug(%d): %s' % (debug_type, debug_msg))
 
     def run(self):
+        if self.session is None:
+            self.curl = pycurl.Curl()
+            try:
+                self._perform()
+            finally:
+                self.curl.close()
+                self.curl = None
+
+            return
+
+        # session handle is shared between threads
+        with self.session.lock:
+            self.curl = self.session.handle()
+            try:
+                self._perform()
+            finally:
+                self.curl = None
+
+    def _perform(self):
+        self._setup()
         self.curl.setopt(pycurl.HTTPHEADER, [
             'Accept-Language: %s' % self.accept_lang,
             'User-Agent: %s' % self.user_agent,
             'Expect:',
-        ])
+        ] + self.headers)
         self.curl.setopt(pycurl.URL, self.url)
 
         if self.proxy:
@@ -142,4 +252,9 @@ class Curl(object):
             self.error = self.curl.errstr()
             self.errno = e.args[0]
         finally:
-            self.curl.close()
+            timing.instance().count(
+                'bytes_sent', int(self.curl.getinfo(pycurl.SIZE_UPLOAD))
+            )
+            timing.instance().count(
+                'bytes_received', int(self.curl.getinfo(pycurl.SIZE_DOWNLOAD))
+            )
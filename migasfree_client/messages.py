@@ -0,0 +1,151 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Background sender of computer status messages
+Messages are coalesced: only the latest pending one is sent to server,
+at most once every interval seconds (and always at exit)
+"""
+
+import time
+import atexit
+import logging
+import threading
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+__all__ = ('MessageSender',)
+
+_NOTHING = object()  # no pending message
+
+
+class MessageSender(object):
+    STOP_TIMEOUT = 30  # max seconds waiting for last message at exit
+
+    def __init__(self, send, interval=5):
+        """
+        send: function(string msg) returning server response
+        """
+
+        self._send = send
+        self.interval = interval
+
+        self._condition = threading.Condition()
+        self._pending = _NOTHING
+        self._sending = False
+        self._last_sent = 0
+        self._responses = []  # to be checked in main thread
+        self._thread = None
+        self._stopping = False
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._loop, name='messages')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while self._pending is _NOTHING and not self._stopping:
+                    self._condition.wait()
+
+                if self._pending is _NOTHING:
+                    return  # stopping
+
+                _wait = self._last_sent + self.interval - time.time()
+                if _wait > 0 and not self._stopping:
+                    self._condition.wait(_wait)
+                    continue  # new messages could have arrived
+
+                _msg = self._pending
+                self._pending = _NOTHING
+                self._sending = True
+
+            try:
+                _response = self._send(_msg)
+            except (Exception, SystemExit):  # thread must survive
+                logging.exception('Error sending message: %s', _msg)
+                _response = None
+
+            with self._condition:
+                self._sending = False
+                self._last_sent = time.time()
+                if _response is not None:
+                    self._responses.append(_response)
+                self._condition.notify_all()
+
+    def post(self, msg):
+        """
+        void post(string msg)
+        replaces pending message (if any)
+        """
+
+        with self._condition:
+            if self._thread is None:
+                self._start()
+
+            self._pending = msg
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        bool flush(float timeout=None)
+        sends pending message now and waits for it
+        returns False if timeout expired
+        """
+
+        _deadline = time.time() + timeout if timeout else None
+        with self._condition:
+            self._last_sent = 0  # do not wait for interval
+            self._condition.notify_all()
+            while self._pending is not _NOTHING or self._sending:
+                if self._thread is None or not self._thread.is_alive():
+                    return False
+
+                _wait = None
+                if _deadline:
+                    _wait = _deadline - time.time()
+                    if _wait <= 0:
+                        return False
+
+                self._condition.wait(_wait)
+
+        return True
+
+    def responses(self):
+        """
+        list responses(void)
+        server responses not checked yet
+        """
+
+        with self._condition:
+            _responses = self._responses
+            self._responses = []
+
+        return _responses
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self.flush(self.STOP_TIMEOUT)
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+
+        self._thread.join(self.STOP_TIMEOUT)
@@ -0,0 +1,144 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Synchronization metrics in Prometheus text format
+(for node_exporter textfile collector)
+"""
+
+import os
+import time
+
+from . import cache, utils
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+__all__ = ('render', 'write')
+
+PREFIX = 'migasfree_client'
+CACHE_NAME = 'metrics'
+
+# name: (type, help)
+METRICS = {
+    'sync_duration_seconds': (
+        'gauge', 'Duration of last synchronization'
+    ),
+    'phase_duration_seconds': (
+        'gauge', 'Duration of each phase of last synchronization'
+    ),
+    'sync_exit_code': (
+        'gauge', 'Exit code of last synchronization (0 is ok)'
+    ),
+    'packages_installed': (
+        'gauge', 'Packages installed in last synchronization'
+    ),
+    'packages_removed': (
+        'gauge', 'Packages removed in last synchronization'
+    ),
+    'packages_upgraded': (
+        'gauge', 'Packages upgraded (new version) in last synchronization'
+    ),
+    'faults': (
+        'gauge', 'Faults found in last synchronization'
+    ),
+    'errors': (
+        'gauge', 'Errors in last synchronization'
+    ),
+    'http_retries': (
+        'gauge', 'HTTP requests retried in last synchronization'
+    ),
+    'last_sync_timestamp_seconds': (
+        'gauge', 'Time of last synchronization'
+    ),
+    'last_success_timestamp_seconds': (
+        'gauge', 'Time of last successful synchronization'
+    ),
+    'syncs_total': (
+        'counter', 'Synchronizations'
+    ),
+    'sync_failures_total': (
+        'counter', 'Failed synchronizations'
+    ),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def render(values):
+    """
+    string render(dict values)
+    values: {name: number or [(labels dict, number), ...]}
+    """
+
+    _lines = []
+    for _name in sorted(values):
+        _type, _help = METRICS[_name]
+        _metric = '{0}_{1}'.format(PREFIX, _name)
+        _lines.append('# HELP {0} {1}'.format(_metric, _help))
+        _lines.append('# TYPE {0} {1}'.format(_metric, _type))
+
+        _samples = values[_name]
+        if not isinstance(_samples, list):
+            _samples = [({}, _samples)]
+
+        for _labels, _value in _samples:
+            _label_text = ','.join(
+                '{0}="{1}"'.format(_key, _escape(_labels[_key]))
+                for _key in sorted(_labels)
+            )
+            _lines.append('{0}{1} {2}'.format(
+                _metric,
+                '{%s}' % _label_text if _label_text else '',
+                _value
+            ))
+
+    return '\n'.join(_lines) + '\n'
+
+
+def write(filename, run):
+    """
+    bool write(string filename, dict run)
+    run: metrics of last synchronization (exit_code is mandatory)
+    counters and timestamps are accumulated in cache
+    file is replaced atomically (scrapes never read partial data)
+    """
+
+    _now = int(time.time())
+    _state = cache.load(CACHE_NAME, {})
+    _state['syncs'] = _state.get('syncs', 0) + 1
+    _state['last_sync'] = _now
+    if run['exit_code'] == os.EX_OK:
+        _state['last_success'] = _now
+    else:
+        _state['failures'] = _state.get('failures', 0) + 1
+    cache.save(CACHE_NAME, _state)
+
+    _values = dict(run)
+    _values['sync_exit_code'] = _values.pop('exit_code')
+    _values['syncs_total'] = _state['syncs']
+    _values['sync_failures_total'] = _state.get('failures', 0)
+    _values['last_sync_timestamp_seconds'] = _state['last_sync']
+    if 'last_success' in _state:
+        _values['last_success_timestamp_seconds'] = _state['last_success']
+
+    if not os.path.isdir(os.path.dirname(filename)):
+        return False  # textfile collector is not installed
+
+    return utils.write_file_atomically(filename, render(_values))
@@ -0,0 +1,731 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+LAN peer package cache (served by migasfree-agent)
+
+Repositories are accessed through http://127.0.0.1:<port>/<server>/...
+(as Package_Proxy_Cache), only from this computer and only for paths of
+project repositories. Metadata is always requested to upstream
+(server or Package_Proxy_Cache):
+    * Release, InRelease and repomd.xml give SHA256 of package indexes
+      (their signature is verified by the PMS)
+    * package indexes (Packages, primary.xml) matching those hashes give
+      SHA256 of each package
+Packages are stored by SHA256 and searched in order: local store,
+peers (GET /sha256/<hash>, allowed from local network and configured
+peers), upstream. Packages are verified against their SHA256 before being
+stored or served. Packages not found in indexes are passed through
+(not stored).
+"""
+
+import io
+import os
+import re
+import bz2
+import gzip
+import time
+import socket
+import struct
+import hashlib
+import logging
+import threading
+
+try:
+    import lzma
+except ImportError:
+    lzma = None  # .xz indexes are not parsed
+
+try:
+    from urllib import quote, unquote
+except ImportError:
+    from urllib.parse import quote, unquote
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from . import settings, cache, curl
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+__all__ = ('PeerCache', 'is_running')
+
+CACHE_NAME = 'peer_index'
+PACKAGE_SUFFIXES = ('.deb', '.udeb', '.rpm')
+PEER_TIMEOUT = 2  # seconds to connect to a peer
+PEER_RETRY = 300  # seconds before asking again a failed peer
+INDEX_MAX_AGE = 30 * 24 * 60 * 60  # indexes not requested are forgotten
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_running(port, host='127.0.0.1'):
+    """
+    bool is_running(int port, string host='127.0.0.1')
+    """
+
+    _socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    _socket.settimeout(1)
+    try:
+        _socket.connect((host, port))
+        return True
+    except socket.error:
+        return False
+    finally:
+        _socket.close()
+
+
+def is_loopback(address):
+    """
+    bool is_loopback(string address)
+    """
+
+    return address.startswith('127.') or address in ['::1', '::ffff:127.0.0.1']
+
+
+def in_network(address, network):
+    """
+    bool in_network(string address, string network)
+    network: 'a.b.c.d/cidr'
+    """
+
+    try:
+        _net, _cidr = network.split('/')
+        _mask = (0xffffffff << (32 - int(_cidr))) & 0xffffffff
+        _address = struct.unpack('!L', socket.inet_aton(address))[0]
+        _net = struct.unpack('!L', socket.inet_aton(_net))[0]
+    except (ValueError, socket.error, struct.error):
+        return False
+
+    return _address & _mask == _net & _mask
+
+
+def _decompress(filename, content):
+    if filename.endswith('.gz'):
+        return gzip.GzipFile(fileobj=io.BytesIO(content)).read()
+    if filename.endswith('.bz2'):
+        return bz2.decompress(content)
+    if filename.endswith('.xz'):
+        return lzma.decompress(content) if lzma else None
+
+    return content
+
+
+def parse_release(base, content):
+    """
+    dict parse_release(string base, string content)
+    Debian Release (or InRelease) SHA256 section: {path: sha256}
+    """
+
+    _index = {}
+    _section = False
+    for _line in content.splitlines():
+        if not _line.startswith(' '):
+            _section = _line.strip() == 'SHA256:'
+            continue
+
+        _fields = _line.split()
+        if _section and len(_fields) == 3:
+            _index['{0}/{1}'.format(base, _fields[2])] = _fields[0].lower()
+
+    return _index
+
+
+def parse_repomd(base, content):
+    """
+    dict parse_repomd(string base, string content)
+    rpm-md repomd.xml: {path: sha256}
+    """
+
+    _index = {}
+    for _data in re.findall(r'<data\b.*?</data>', content, re.S):
+        _checksum = re.search(
+            r'<checksum[^>]*type="sha256"[^>]*>([0-9a-fA-F]{64})</checksum>',
+            _data
+        )
+        _location = re.search(r'<location[^>]*href="([^"]+)"', _data)
+        if _checksum and _location:
+            _index['{0}/{1}'.format(base, _location.group(1))] = \
+                _checksum.group(1).lower()
+
+    return _index
+
+
+def parse_packages(base, content):
+    """
+    dict parse_packages(string base, string content)
+    Debian Packages index: {path: sha256}
+    """
+
+    _index = {}
+    _filename = _sha256 = None
+    for _line in content.splitlines() + ['']:
+        if not _line.strip():
+            if _filename and _sha256:
+                _index['{0}/{1}'.format(base, _filename)] = _sha256.lower()
+            _filename = _sha256 = None
+        elif _line.startswith('Filename:'):
+            _filename = _line.split(':', 1)[1].strip()
+        elif _line.startswith('SHA256:'):
+            _sha256 = _line.split(':', 1)[1].strip()
+
+    return _index
+
+
+def parse_primary(base, content):
+    """
+    dict parse_primary(string base, string content)
+    rpm-md primary.xml: {path: sha256}
+    """
+
+    _index = {}
+    for _package in re.findall(r'<package\b.*?</package>', content, re.S):
+        _checksum = re.search(
+            r'<checksum[^>]*type="sha256"[^>]*>([0-9a-fA-F]{64})</checksum>',
+            _package
+        )
+        _location = re.search(r'<location[^>]*href="([^"]+)"', _package)
+        if _checksum and _location:
+            _index['{0}/{1}'.format(base, _location.group(1))] = \
+                _checksum.group(1).lower()
+
+    return _index
+
+
+def parse_metadata(path, content):
+    """
+    (string, dict) parse_metadata(string path, bytes content)
+    returns ('signed', {path: sha256}) for Release, InRelease and repomd.xml,
+    ('packages', {path: sha256}) for package indexes
+    or (None, {}) for other files
+    """
+
+    _name = os.path.basename(path)
+    if _name in ['Release', 'InRelease']:
+        _kind, _base, _parse = 'signed', os.path.dirname(path), parse_release
+    elif _name == 'repomd.xml' and '/repodata/' in path:
+        _kind, _base, _parse = 'signed', path.split('/repodata/')[0], parse_repomd
+    elif _name.split('.')[0] == 'Packages':
+        if '/dists/' in path:
+            _base = path.split('/dists/')[0]
+        else:  # flat repository
+            _base = os.path.dirname(path)
+        _kind, _parse = 'packages', parse_packages
+    elif _name.endswith(('primary.xml', 'primary.xml.gz', 'primary.xml.bz2', 'primary.xml.xz')) \
+            and '/repodata/' in path:
+        _kind, _base, _parse = 'packages', path.split('/repodata/')[0], parse_primary
+    else:
+        return None, {}
+
+    try:
+        _content = _decompress(_name, content)
+        if _content is None:
+            return None, {}
+
+        return _kind, _parse(_base, _content.decode('utf8', 'replace'))
+    except (IOError, EOFError, ValueError) as e:
+        logging.warning('Peer cache: index %s not parsed: %s', path, e)
+        return None, {}
+
+
+def file_sha256(filename):
+    """
+    string file_sha256(string filename)
+    """
+
+    _hash = hashlib.sha256()
+    with open(filename, 'rb') as _fp:
+        while True:
+            _data = _fp.read(1024 * 1024)
+            if not _data:
+                break
+            _hash.update(_data)
+
+    return _hash.hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'migasfree-peer-cache'
+
+    def log_message(self, format, *args):
+        logging.debug('Peer cache: %s - %s', self.address_string(), format % args)
+
+    def _send_file(self, filename, headers=None):
+        _size = os.path.getsize(filename)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(_size))
+        for _name, _value in (headers or {}).items():
+            if _value:
+                self.send_header(_name, _value)
+        self.end_headers()
+
+        if self.command == 'HEAD':
+            return
+
+        with open(filename, 'rb') as _fp:
+            while True:
+                _data = _fp.read(64 * 1024)
+                if not _data:
+                    break
+                self.wfile.write(_data)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        _cache = self.server.cache
+        _path = unquote(self.path.split('?')[0])
+        _client = self.client_address[0]
+
+        if _path.startswith('/sha256/'):  # request of a peer
+            if not _cache.is_peer_allowed(_client):
+                self.send_error(403)
+                return
+
+            _filename = _cache.stored(_path[len('/sha256/'):])
+            if _filename:
+                self._send_file(_filename)
+            else:
+                self.send_error(404)
+            return
+
+        # repositories are only proxied for this computer
+        if not is_loopback(_client) or not _cache.is_repository_path(_path):
+            self.send_error(404)
+            return
+
+        if _path.endswith(PACKAGE_SUFFIXES) and self.command == 'GET':
+            _filename, _temporary = _cache.package(_path)
+            if not _filename:
+                self.send_error(502)
+                return
+
+            try:
+                self._send_file(_filename)
+            finally:
+                if _temporary:
+                    os.remove(_filename)
+            return
+
+        _forward = []
+        for _name in ['If-Modified-Since', 'If-None-Match']:
+            if self.headers.get(_name):
+                _forward.append('{0}: {1}'.format(_name, self.headers.get(_name)))
+
+        _code, _filename, _headers = _cache.metadata(
+            _path, _forward, head=self.command == 'HEAD'
+        )
+        try:
+            if _code == 200:
+                self._send_file(_filename, _headers)
+            elif _code == 304:
+                self.send_response(304)
+                self.end_headers()
+            else:
+                self.send_error(_code or 502)
+        finally:
+            if _filename:
+                os.remove(_filename)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class PeerCache(object):
+    def __init__(
+        self,
+        port,
+        upstream,
+        server,
+        project,
+        peers=None,
+        networks=None,
+        path=None,
+        cert=None,
+        proxy='',
+        address=''
+    ):
+        """
+        upstream: 'protocol://' + Package_Proxy_Cache (if any)
+        server, project: only their repositories are proxied
+        peers: list of 'host:port'
+        networks: list of 'a.b.c.d/cidr' allowed to get packages (besides peers)
+        address: where peers are served ('' is none, '0.0.0.0' is all
+        interfaces). This computer is always served in 127.0.0.1
+        """
+
+        self.port = port
+        self.upstream = upstream if upstream.endswith('/') else upstream + '/'
+        self.server = server
+        self.project = project
+        self.peers = peers or []
+        self.networks = networks or []
+        self.path = path or os.path.join(settings.CACHE_PATH, 'packages')
+        self.cert = cert
+        self.proxy = proxy
+        self.address = address
+
+        # index entries are replaced, never modified (lock is only held
+        # to read or swap them)
+        self._lock = threading.Lock()
+        # {index path: {'seen': time, 'files': {path: sha256}}}
+        self._signed = {}  # Release, InRelease, repomd.xml
+        self._indexes = {}  # Packages, primary.xml
+        self._version = 0  # changes of index entries
+        self._saved = 0  # last version saved in cache
+        self._save_lock = threading.Lock()
+        self._failed_peers = {}  # {peer: time}
+        self._servers = []
+
+        _state = cache.load(CACHE_NAME, {})
+        if 'signed' in _state and 'indexes' in _state:
+            self._signed = _state['signed']
+            self._indexes = _state['indexes']
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, 0o755)
+
+    def _addresses(self):
+        if self.address == '0.0.0.0':
+            return [self.address]  # loopback included
+
+        if not self.address or is_loopback(self.address):
+            return ['127.0.0.1']
+
+        return ['127.0.0.1', self.address]
+
+    def start(self):
+        for _address in self._addresses():
+            _server = _Server((_address, self.port), _Handler)
+            _server.cache = self
+            _thread = threading.Thread(
+                target=_server.serve_forever, name='peercache'
+            )
+            _thread.daemon = True
+            _thread.start()
+            self._servers.append(_server)
+            logging.info('Peer cache listening on %s:%d', _address, self.port)
+
+    def stop(self):
+        for _server in self._servers:
+            _server.shutdown()
+            _server.server_close()
+        self._servers = []
+
+    def is_peer_allowed(self, address):
+        """
+        bool is_peer_allowed(string address)
+        """
+
+        if is_loopback(address):
+            return True
+
+        if address in [_peer.rsplit(':', 1)[0] for _peer in self.peers]:
+            return True
+
+        return any(in_network(address, _network) for _network in self.networks)
+
+    def is_repository_path(self, path):
+        """
+        bool is_repository_path(string path)
+        path must be /<server>/.../<project>/... (no relative segments)
+        """
+
+        _segments = path.split('/')
+        if '..' in _segments or '.' in _segments:
+            return False
+
+        _prefix = '/{0}/'.format(self.server)
+        if not path.startswith(_prefix):
+            return False
+
+        return '/{0}/'.format(self.project) in path[len(_prefix) - 1:]
+
+    def _save(self):
+        # serialized outside of lock: requests are served meanwhile
+        with self._save_lock:
+            with self._lock:
+                _version = self._version
+                _state = {
+                    'signed': dict(self._signed),
+                    'indexes': dict(self._indexes)
+                }
+
+            if _version > self._saved:  # not saved yet by a later call
+                cache.save(CACHE_NAME, _state)
+                self._saved = _version
+
+    def _package_sha256(self, path):
+        # lock must be held
+        for _index in self._indexes.values():
+            if path in _index['files']:
+                return _index['files'][path]
+
+        return None
+
+    def _signed_sha256(self, path):
+        # lock must be held
+        for _signed in self._signed.values():
+            if path in _signed['files']:
+                return _signed['files'][path]
+
+        return None
+
+    def _signed_path(self, sha256):
+        # lock must be held
+        for _signed in self._signed.values():
+            for _path, _sha256 in _signed['files'].items():
+                if _sha256 == sha256:
+                    return _path
+
+        return None
+
+    def stored(self, sha256):
+        """
+        string stored(string sha256)
+        filename of stored package or None
+        (content is verified, corrupted files are removed)
+        """
+
+        if not _SHA256_RE.match(sha256):
+            return None
+
+        _filename = os.path.join(self.path, sha256)
+        if not os.path.isfile(_filename):
+            return None
+
+        if file_sha256(_filename) != sha256:
+            logging.warning('Peer cache: %s is corrupted', _filename)
+            os.remove(_filename)
+            return None
+
+        os.utime(_filename, None)  # last use (LRU)
+
+        return _filename
+
+    def _download(self, url, filename, headers=None, timeout=0, head=False):
+        """
+        (int, string, Curl) _download(string url, string filename, ...)
+        returns (http code, sha256 of content, curl object)
+        """
+
+        _hash = hashlib.sha256()
+        with open(filename, 'wb') as _fp:
+            def _write(data):
+                _fp.write(data)
+                _hash.update(data)
+
+            _curl = curl.Curl(
+                url,
+                proxy=self.proxy,
+                cert=self.cert,
+                headers=headers,
+                write=_write,
+                head=head,
+                connect_timeout=timeout
+            )
+            _curl.run()
+
+        if _curl.error:
+            logging.debug('Peer cache: %s: %s', url, _curl.error)
+            return 0, None, _curl
+
+        return _curl.http_code, _hash.hexdigest(), _curl
+
+    def _upstream_url(self, path):
+        return self.upstream + quote(path.lstrip('/'), safe='/:+~@')
+
+    def _tmp_file(self):
+        return os.path.join(
+            self.path,
+            '.{0}.{1}.tmp'.format(os.getpid(), threading.current_thread().ident)
+        )
+
+    def _store(self, tmp_file, sha256):
+        _filename = os.path.join(self.path, sha256)
+        os.rename(tmp_file, _filename)
+
+        return _filename
+
+    def _from_peers(self, sha256):
+        for _peer in self.peers:
+            with self._lock:
+                _failed = self._failed_peers.get(_peer)
+            if _failed and _failed + PEER_RETRY > time.time():
+                continue
+
+            _tmp_file = self._tmp_file()
+            _code, _sha256, _ = self._download(
+                'http://{0}/sha256/{1}'.format(_peer, sha256),
+                _tmp_file,
+                timeout=PEER_TIMEOUT
+            )
+            if _code == 200 and _sha256 == sha256:
+                logging.info('Peer cache: %s from peer %s', sha256, _peer)
+                return self._store(_tmp_file, sha256)
+
+            os.remove(_tmp_file)
+            if _code == 0:
+                with self._lock:
+                    self._failed_peers[_peer] = time.time()
+            elif _code == 200:
+                logging.warning(
+                    'Peer cache: peer %s sent wrong content for %s', _peer, sha256
+                )
+
+        return None
+
+    def package(self, path):
+        """
+        (string, bool) package(string path)
+        returns (filename, temporary)
+        packages in indexes are verified and stored (downloaded if needed)
+        other packages are downloaded to a temporary file (not stored)
+        """
+
+        with self._lock:
+            _sha256 = self._package_sha256(path)
+
+        if _sha256:
+            _filename = self.stored(_sha256) or self._from_peers(_sha256)
+            if _filename:
+                return _filename, False
+
+        _tmp_file = self._tmp_file()
+        _code, _downloaded, _ = self._download(self._upstream_url(path), _tmp_file)
+        if _code != 200 or (_sha256 and _downloaded != _sha256):
+            logging.warning(
+                'Peer cache: %s not downloaded (%s, %s)', path, _code, _downloaded
+            )
+            os.remove(_tmp_file)
+            return None, False
+
+        if not _sha256:
+            logging.debug('Peer cache: %s is not in indexes, not stored', path)
+            return _tmp_file, True
+
+        return self._store(_tmp_file, _downloaded), False
+
+    def _index_metadata(self, path, filename, sha256):
+        """
+        indexes are parsed without lock (other requests are served
+        meanwhile) and then swapped in
+        """
+
+        _name = path
+        if '/by-hash/SHA256/' in path:  # acquire by hash (apt)
+            with self._lock:
+                _name = self._signed_path(sha256) or path
+
+        with open(filename, 'rb') as _fp:
+            _kind, _files = parse_metadata(_name, _fp.read())
+        if _kind is None:
+            return
+
+        _entry = {'seen': time.time(), 'files': _files}
+        with self._lock:
+            if _kind == 'packages':
+                # index must be listed in signed metadata
+                if self._signed_sha256(_name) != sha256:
+                    logging.warning(
+                        'Peer cache: index %s is not in signed metadata', path
+                    )
+                    return
+
+                self._indexes[_name] = _entry
+            else:
+                self._signed[_name] = _entry
+            self._version += 1
+
+        self._save()
+
+    def metadata(self, path, headers=None, head=False):
+        """
+        (int, string, dict) metadata(string path, list headers=None, bool head=False)
+        returns (http code, temporary filename, response headers)
+        signed metadata and indexes of packages are parsed
+        """
+
+        _tmp_file = self._tmp_file()
+        _code, _sha256, _curl = self._download(
+            self._upstream_url(path), _tmp_file, headers=headers, head=head
+        )
+        if _code != 200:
+            os.remove(_tmp_file)
+            return _code, None, {}
+
+        if not head:
+            self._index_metadata(path, _tmp_file, _sha256)
+
+        return _code, _tmp_file, {
+            'Last-Modified': _curl.get_header('Last-Modified'),
+            'ETag': _curl.get_header('ETag'),
+        }
+
+    def prune(self, max_size, max_age=INDEX_MAX_AGE):
+        """
+        int prune(int max_size, int max_age=INDEX_MAX_AGE)
+        indexes not requested in max_age seconds are forgotten and
+        packages not in indexes are removed. Then, least recently used
+        packages are removed until store is under max_size bytes.
+        returns freed bytes
+        """
+
+        _limit = time.time() - max_age
+        with self._lock:
+            for _group in [self._signed, self._indexes]:
+                for _path in list(_group):
+                    if _group[_path]['seen'] < _limit:
+                        del _group[_path]
+                        self._version += 1
+            _indexes = list(self._indexes.values())
+        self._save()
+
+        _known = set()
+        for _index in _indexes:
+            _known.update(_index['files'].values())
+
+        _files = []
+        _freed = 0
+        for _name in os.listdir(self.path):
+            if not _SHA256_RE.match(_name):
+                continue
+            _filename = os.path.join(self.path, _name)
+            _stat = os.stat(_filename)
+            if _name not in _known:
+                os.remove(_filename)
+                _freed += _stat.st_size
+                continue
+            _files.append((_stat.st_mtime, _stat.st_size, _filename))
+
+        _size = 0
+        for _mtime, _file_size, _filename in sorted(_files, reverse=True):
+            if _size + _file_size <= max_size:
+                _size += _file_size
+                continue
+
+            os.remove(_filename)
+            _freed += _file_size
+
+        return _freed
@@ -0,0 +1,196 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Synchronization scheduling, to spread the load of the fleet in the server:
+    * random splay before unattended synchronizations
+    * exponential backoff (with jitter) while server is overloaded
+    * short retry while server is unreachable (network errors)
+    * server hints (Retry-After header, 'next_sync_after' in computer info)
+State is persisted in cache, so it is shared by migasfree and migasfree-agent
+"""
+
+import time
+import random
+import logging
+
+from email.utils import parsedate_tz, mktime_tz
+
+from . import cache
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+__all__ = (
+    'Scheduler', 'is_overloaded', 'is_unreachable', 'parse_retry_after'
+)
+
+CACHE_NAME = 'scheduler'
+
+OVERLOADED_HTTP_CODES = [429, 500, 502, 503, 504]
+NETWORK_ERROR = 0  # no response (curl error)
+
+
+def is_overloaded(http_code):
+    """
+    bool is_overloaded(int http_code)
+    """
+
+    return http_code in OVERLOADED_HTTP_CODES
+
+
+def is_unreachable(http_code):
+    """
+    bool is_unreachable(int http_code)
+    offline computer, DNS error, server down...
+    """
+
+    return http_code == NETWORK_ERROR
+
+
+def parse_retry_after(value):
+    """
+    int parse_retry_after(string value)
+    returns seconds from a Retry-After header (delay-seconds or HTTP-date)
+    """
+
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+
+    _date = parsedate_tz(value)
+    if _date is None:
+        return None
+
+    return max(int(mktime_tz(_date) - time.time()), 0)
+
+
+class Scheduler(object):
+    BACKOFF_BASE = 60  # seconds after first failure
+    UNREACHABLE_MAX = 600  # network errors are not server load
+
+    def __init__(self, interval=3600, jitter=600, backoff_max=21600):
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff_max = backoff_max
+
+        self.state = cache.load(CACHE_NAME, {})
+        self.state.setdefault('failures', 0)
+        self.state.setdefault('network_failures', 0)
+        self.state.setdefault('not_before', 0)
+
+    def _save(self):
+        cache.save(CACHE_NAME, self.state)
+
+    def splay(self, seconds):
+        """
+        float splay(int seconds)
+        random delay in [0, seconds]
+        """
+
+        return random.uniform(0, max(seconds, 0))
+
+    def deferred(self):
+        """
+        float deferred(void)
+        seconds until server accepts a new synchronization (0 if it does)
+        """
+
+        return max(self.state['not_before'] - time.time(), 0)
+
+    def next_delay(self):
+        """
+        float next_delay(void)
+        seconds until next periodic synchronization
+        """
+
+        return max(
+            self.deferred(),
+            self.interval + self.splay(self.jitter)
+        )
+
+    def backoff(self, failures=None, limit=None):
+        """
+        float backoff(int failures=None, int limit=None)
+        exponential delay with jitter ("equal jitter") for failures
+        (default: current failures) capped by limit (default: backoff_max)
+        """
+
+        if failures is None:
+            failures = self.state['failures']
+        if limit is None:
+            limit = self.backoff_max
+
+        _delay = min(self.BACKOFF_BASE * 2 ** max(failures - 1, 0), limit)
+
+        return _delay / 2.0 + self.splay(_delay / 2.0)
+
+    def succeeded(self, hint=None):
+        """
+        void succeeded(int hint=None)
+        hint: seconds requested by server before next synchronization
+        """
+
+        _now = time.time()
+        self.state['failures'] = 0
+        self.state['network_failures'] = 0
+        self.state['last_sync'] = _now
+        self.state['not_before'] = _now + hint if hint else 0
+        self._save()
+
+    def failed(self, retry_after=None):
+        """
+        void failed(int retry_after=None)
+        server is overloaded
+        """
+
+        self.state['failures'] += 1
+        self.state['network_failures'] = 0
+        _delay = self.backoff()
+        if retry_after:
+            _delay = max(_delay, min(retry_after, self.backoff_max))
+
+        self.state['not_before'] = time.time() + _delay
+        self._save()
+
+        logging.warning(
+            'Server overloaded (failures: %d), next synchronization in %d seconds',
+            self.state['failures'], _delay
+        )
+
+    def unreachable(self):
+        """
+        void unreachable(void)
+        server could not be contacted: retried soon (UNREACHABLE_MAX)
+        """
+
+        self.state['network_failures'] += 1
+        _delay = self.backoff(
+            self.state['network_failures'],
+            min(self.UNREACHABLE_MAX, self.backoff_max)
+        )
+
+        self.state['not_before'] = time.time() + _delay
+        self._save()
+
+        logging.warning(
+            'Server unreachable (network error, failures: %d), '
+            'next synchronization in %d seconds',
+            self.state['network_failures'], _delay
+        )
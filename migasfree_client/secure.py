@@ -18,9 +18,22 @@
 
 import os
 import sys
+import ssl
 import json
+import calendar
+import tempfile
+import subprocess
 
-from . import utils, server_errors
+try:
+    from cryptography import x509
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+except ImportError:
+    InvalidSignature = None  # fallback to openssl command
+
+from . import server_errors, timing
 
 import gettext
 _ = gettext.gettext
@@ -30,88 +43,179 @@ __license__ = 'GPLv3'
 
 # TODO common code between server & client
 
+SIGN_LENGTH = 256  # RSA 2048 bits signature appended to messages
+
+_keys = {}  # loaded keys cache: {path: (mtime, key)}
+
+
+def _load_key(filename, private=True):
+    _mtime = os.path.getmtime(filename)
+    if filename in _keys and _keys[filename][0] == _mtime:
+        return _keys[filename][1]
+
+    with open(filename, 'rb') as _fp:
+        _content = _fp.read()
+
+    if private:
+        _key = serialization.load_pem_private_key(
+            _content, password=None, backend=default_backend()
+        )
+    else:
+        _key = serialization.load_pem_public_key(
+            _content, backend=default_backend()
+        )
+
+    _keys[filename] = (_mtime, _key)
+
+    return _key
 
-def sign(filename, private_key):
+
+def sign(data, private_key):
     """
-    void sign(string filename, string private_key)
-    Creates a temporal file named 'filename.sign'
-    TODO find python equivalent
+    bytes sign(bytes data, string private_key)
+    Returns RSA-SHA1 signature of data
     """
 
-    os.system(
-        "openssl dgst -sha1 -sign %s -out %s %s" % (
-            private_key,
-            '{0}.sign'.format(filename),
-            filename
+    if InvalidSignature is not None:
+        return _load_key(private_key).sign(
+            data, padding.PKCS1v15(), hashes.SHA1()
         )
+
+    timing.instance().count('subprocesses')
+    _process = subprocess.Popen(
+        ['openssl', 'dgst', '-sha1', '-sign', private_key],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE
     )
+    _signature, _ = _process.communicate(data)
+
+    return _signature
+
+
+def verify(data, signature, public_key):
+    """
+    bool verify(bytes data, bytes signature, string public_key)
+    """
+
+    if InvalidSignature is not None:
+        try:
+            _load_key(public_key, private=False).verify(
+                signature, data, padding.PKCS1v15(), hashes.SHA1()
+            )
+        except (InvalidSignature, IOError, OSError, ValueError):
+            return False  # bad signature, missing or invalid key
+
+        return True
+
+    # openssl needs signature in a file
+    _fd, _sign_file = tempfile.mkstemp()
+    try:
+        with os.fdopen(_fd, 'wb') as _fp:
+            _fp.write(signature)
+
+        timing.instance().count('subprocesses')
+        _process = subprocess.Popen(
+            [
+                'openssl', 'dgst', '-sha1',
+                '-verify', public_key,
+                '-signature', _sign_file
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        _process.communicate(data)
+    finally:
+        os.remove(_sign_file)
 
+    return _process.returncode == 0
 
-def verify(filename, public_key):
+
+def cert_expiry(cert_file):
     """
-    bool verify(string filename, string public_key)
-    TODO find python equivalent
+    float cert_expiry(string cert_file)
+    returns expiration timestamp of a PEM certificate
+    or None if it can not be decoded
     """
 
-    return (os.system(
-        "openssl dgst -sha1 -verify %s -signature %s %s 1>/dev/null" % (
-            public_key,
-            '{0}.sign'.format(filename),
-            filename
-        )) == 0)
+    if InvalidSignature is not None:
+        try:
+            with open(cert_file, 'rb') as _fp:
+                _cert = x509.load_pem_x509_certificate(
+                    _fp.read(), default_backend()
+                )
+        except (IOError, OSError, ValueError):
+            return None
+
+        # not_valid_after is deprecated (naive datetime) in recent versions
+        _not_after = getattr(_cert, 'not_valid_after_utc', None) \
+            or _cert.not_valid_after
+
+        return float(calendar.timegm(_not_after.utctimetuple()))
+
+    timing.instance().count('subprocesses')
+    _process = subprocess.Popen(
+        ['openssl', 'x509', '-enddate', '-noout', '-in', cert_file],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    _output, _ = _process.communicate()
+    if sys.version_info[0] > 2:
+        _output = str(_output, encoding='utf8')
+
+    # notAfter=Jun  1 12:00:00 2030 GMT
+    if _process.returncode != 0 or not _output.startswith('notAfter='):
+        return None
+
+    try:
+        return ssl.cert_time_to_seconds(_output.strip().split('=', 1)[1])
+    except ValueError:
+        return None
 
 
-def wrap(filename, data, key=None):
+def wrap(data, key=None):
     """
-    void wrap(string filename, data, string key = None)
-    Creates a JSON file with data
-    If key, signs JSON file
+    bytes wrap(data, string key = None)
+    Returns data in JSON format
+    If key, appends signature to JSON content
     """
 
     data = json.dumps(data)
     if sys.version_info[0] > 2:
         data = data.encode()
 
-    with open(filename, 'wb') as _fp:
-        _fp.write(data)
-
-    # os.system('less %s; read' % filename)  # DEBUG
-
     if key:
-        sign(filename, key)
-        with open(filename, 'ab') as _fp:
-            _fp.write(open('{0}.sign'.format(filename), 'rb').read())
-        os.remove('{0}.sign'.format(filename))  # remove temp file (sign function)
+        data += sign(data, key)
+
+    return data
 
 
-def unwrap(filename, key=None):
+def unwrap(content, key=None):
     """
-    dict unwrap(string filename, string key = None)
-    filename is a JSON file (signed or not)
-    If key, verifies JSON file
-    Returns data from filename or {} if sign is not verificable
+    dict unwrap(bytes content, string key = None)
+    content is a JSON message (signed or not)
+    If key, verifies JSON message
+    Returns data from content or {} if sign is not verificable
     """
 
+    _signature = None
     if key:
-        _content = open(filename, 'rb').read()
-        _n = len(_content)
-        utils.write_file('{0}.sign'.format(filename), _content[_n - 256:_n])
-        utils.write_file(filename, _content[0:_n - 256])
+        _n = len(content)
+        _signature = content[_n - SIGN_LENGTH:_n]
+        content = content[0:_n - SIGN_LENGTH]
 
     try:
-        _content = open(filename, 'rb').read()
         if sys.version_info[0] < 3:
-            _data = json.loads(_content)
+            _data = json.loads(content)
         else:
-            _data = json.loads(str(_content, encoding='utf8'))
+            _data = json.loads(str(content, encoding='utf8'))
     except ValueError:
-        print(_('No response'), filename)
+        print(_('No response'))
         return {}  # no response in JSON format
 
     if not key:
         return _data
 
-    if not verify(filename, key):
+    if not verify(content, _signature, key):
         return {
             'errmfs': {
                 'code': server_errors.INVALID_SIGNATURE,
@@ -119,5 +223,4 @@ def unwrap(filename, key=None):
             }
         }
 
-    os.remove('{0}.sign'.format(filename))  # remove temp file (verify function)
     return _data
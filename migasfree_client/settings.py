@@ -24,10 +24,13 @@ CONF_FILE = os.environ.get('MIGASFREE_CONF', '/etc/migasfree.conf')
 
 LOG_FILE = '/var/tmp/migasfree.log'
 SOFTWARE_FILE = '/var/tmp/installed_software.txt'
+TIMING_FILE = '/var/tmp/migasfree-timing.json'
 
 KEYS_PATH = '/var/migasfree-client/keys'
 DEVICES_PATH = '/var/migasfree-client/devices'
+CACHE_PATH = '/var/migasfree-client/cache'
 TMP_PATH = '/tmp/migasfree-client'
+RUN_PATH = '/var/run/migasfree-client'
 LOCALE_PATH = '/usr/share/locale'
 ICON_PATH = '/usr/share/icons/hicolor/scalable'
 DOC_PATH = '/usr/share/doc/migasfree-client'
@@ -35,4 +38,4 @@ APP_DATA_PATH = '/usr/share/migasfree-client'
 PRE_SYNC_PATH = os.path.join(APP_DATA_PATH, 'pre-sync.d')
 POST_SYNC_PATH = os.path.join(APP_DATA_PATH, 'post-sync.d')
 
-CERT_FILE = os.path.join(TMP_PATH, 'cert.pem')
+AGENT_SOCKET_FILE = os.path.join(RUN_PATH, 'agent.sock')
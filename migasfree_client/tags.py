@@ -36,6 +36,7 @@ from . import (
     server_errors,
 )
 
+from .agent import trigger
 from .client import MigasFreeClient
 from .command import MigasFreeCommand
 
@@ -191,11 +192,12 @@ class MigasFreeTags(MigasFreeCommand):
 
         return _ret
 
-    def _apply_rules(self, rules):
+    def _apply_rules(self, rules, update=True):
         mfc = MigasFreeClient()
 
         # Update metadata
-        mfc._update_system()
+        if update:
+            mfc._update_system()
 
         # Remove Packages
         mfc._uninstall_packages(rules["packages"]["remove"])
@@ -204,7 +206,7 @@ class MigasFreeTags(MigasFreeCommand):
         mfc._install_mandatory_packages(rules["packages"]["preinstall"])
 
         # Update metadata
-        mfc._clean_pms_cache()
+        mfc._update_metadata(force=True)
 
         # Install Packages
         mfc._install_mandatory_packages(rules["packages"]["install"])
@@ -244,6 +246,12 @@ class MigasFreeTags(MigasFreeCommand):
             help=_('Communicate tags to server')
         )
 
+        parser.add_option(
+            '--refresh-identity',
+            action='store_true',
+            help=_('Read hardware identity again (UUID, SMBIOS, MAC)')
+        )
+
         options, arguments = parser.parse_args()
         logging.info('Program options: %s' % options)
         logging.info('Program arguments: %s' % arguments)
@@ -272,6 +280,9 @@ class MigasFreeTags(MigasFreeCommand):
             self._usage_examples()
             parser.error(_('Get available tags and Set options are exclusive!!!'))
 
+        if options.refresh_identity:
+            utils.refresh_identity()
+
         # actions dispatcher
         if options.get or options.available:
             _response = self._get_tags()
@@ -291,8 +302,11 @@ class MigasFreeTags(MigasFreeCommand):
 
             _response = self._set_tags()
             if options.set:
+                # a running agent synchronizes the computer (with lock)
+                _synced = trigger() is not None
+
                 utils.check_lock_file(self.CMD, self.LOCK_FILE)
-                self._apply_rules(_response)
+                self._apply_rules(_response, update=not _synced)
                 utils.remove_file(self.LOCK_FILE)
         else:
             parser.print_help()
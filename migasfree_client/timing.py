@@ -0,0 +1,237 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Timing instrumentation of synchronizations
+Each span (phase, http request, pms call) records wall time, CPU time
+(process and children), bytes sent and received and subprocesses started
+Counters of a span only include work done in its thread (and in threads
+that adopt it, see parallel_map). CPU time is process-wide, so it
+includes spans running at the same time in other threads
+"""
+
+import os
+import time
+import json
+import functools
+import threading
+
+from contextlib import contextmanager
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+__all__ = ('Tracer', 'instance', 'traced', 'TracedObject')
+
+
+def _cpu_time():
+    _times = os.times()
+
+    return _times[0] + _times[1] + _times[2] + _times[3]
+
+
+class Tracer(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.spans = []
+            self.counters = {
+                'bytes_sent': 0,
+                'bytes_received': 0,
+                'subprocesses': 0,
+                'http_retries': 0,
+            }
+
+    def _open_spans(self):
+        if not hasattr(self._local, 'spans'):
+            self._local.spans = []
+
+        return self._local.spans
+
+    def current(self):
+        """
+        list current(void)
+        counters of open spans in this thread (to be adopted by workers)
+        """
+
+        return list(self._open_spans())
+
+    def adopt(self, spans):
+        """
+        void adopt(list spans)
+        work of this thread is also counted in spans (of another thread)
+        """
+
+        self._local.spans = list(spans)
+
+    def count(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] += value
+            for _counters in self._open_spans():
+                _counters[counter] += value
+
+    @contextmanager
+    def span(self, kind, name):
+        with self._lock:
+            _counters = dict.fromkeys(self.counters, 0)
+        _spans = self._open_spans()
+        _spans.append(_counters)
+        _start = time.time()
+        _cpu = _cpu_time()
+        try:
+            yield
+        finally:
+            _spans.pop()  # spans of a thread are nested
+            _span = {
+                'kind': kind,
+                'name': name,
+                'start': round(_start - self.started, 3),
+                'wall': round(time.time() - _start, 3),
+                'cpu': round(_cpu_time() - _cpu, 3),
+            }
+            with self._lock:
+                _span.update(_counters)
+                self.spans.append(_span)
+
+    def report(self):
+        """
+        dict report(void)
+        """
+
+        with self._lock:
+            _spans = sorted(self.spans, key=lambda x: x['start'])
+            _totals = dict(self.counters)
+
+        _totals['wall'] = round(time.time() - self.started, 3)
+        for _kind in set(_span['kind'] for _span in _spans):
+            _totals['{0}_wall'.format(_kind)] = round(
+                sum(_span['wall'] for _span in _spans if _span['kind'] == _kind),
+                3
+            )
+
+        return {
+            'started': time.strftime(
+                '%Y-%m-%d %H:%M:%S', time.localtime(self.started)
+            ),
+            'totals': _totals,
+            'spans': _spans,
+        }
+
+    def save(self, filename):
+        """
+        bool save(string filename)
+        """
+
+        try:
+            with open(filename, 'w') as _fp:
+                json.dump(self.report(), _fp, indent=2)
+        except IOError:
+            return False
+
+        return True
+
+    def format(self):
+        """
+        string format(void)
+        report as text table
+        """
+
+        _report = self.report()
+        _lines = ['%-6s %-40s %8s %8s %8s %10s %10s %5s' % (
+            'kind', 'name', 'start', 'wall', 'cpu', 'sent', 'received', 'proc'
+        )]
+        for _span in _report['spans']:
+            _lines.append('%-6s %-40s %8.2f %8.2f %8.2f %10d %10d %5d' % (
+                _span['kind'],
+                _span['name'][:40],
+                _span['start'],
+                _span['wall'],
+                _span['cpu'],
+                _span['bytes_sent'],
+                _span['bytes_received'],
+                _span['subprocesses'],
+            ))
+
+        _totals = _report['totals']
+        _lines.append('%-6s %-40s %8s %8.2f %8s %10d %10d %5d' % (
+            'total', '', '', _totals['wall'], '',
+            _totals['bytes_sent'],
+            _totals['bytes_received'],
+            _totals['subprocesses'],
+        ))
+
+        return '\n'.join(_lines)
+
+
+_instance = None
+
+
+def instance():
+    """
+    Tracer instance(void)
+    process-wide tracer
+    """
+
+    global _instance
+
+    if _instance is None:
+        _instance = Tracer()
+
+    return _instance
+
+
+def traced(kind, name=None):
+    """
+    decorator: function calls are recorded as spans
+    (name defaults to function name)
+    """
+
+    def decorator(func):
+        _name = name or func.__name__.strip('_')
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with instance().span(kind, _name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracedObject(object):
+    """
+    Proxy that records public method calls of obj as spans
+    """
+
+    def __init__(self, obj, kind):
+        self._obj = obj
+        self._kind = kind
+
+    def __getattr__(self, name):
+        _attr = getattr(self._obj, name)
+        if name.startswith('_') or not callable(_attr):
+            return _attr
+
+        return traced(self._kind, name)(_attr)
+
+    def __str__(self):
+        return str(self._obj)
@@ -290,6 +290,10 @@ class MigasFreeUpload(MigasFreeCommand):
             "--no-create-repo", "-c", action="store_true",
             help=_('No create repository after upload file at server')
         )
+        parser.add_option(
+            "--refresh-identity", action="store_true",
+            help=_('Read hardware identity again (UUID, SMBIOS, MAC)')
+        )
 
         options, arguments = parser.parse_args()
 
@@ -309,6 +313,9 @@ class MigasFreeUpload(MigasFreeCommand):
 
         utils.check_lock_file(self.CMD, self.LOCK_FILE)
 
+        if options.refresh_identity:
+            utils.refresh_identity()
+
         # assign config options
         if options.user:
             self.packager_user = options.user
@@ -22,9 +22,10 @@ import os
 import sys
 import errno
 import logging
+import threading
 import pycurl
 
-from . import secure, curl, utils, server_errors
+from . import secure, curl, utils, server_errors, scheduler, timing
 
 import gettext
 _ = gettext.gettext
@@ -48,7 +49,9 @@ class UrlRequest(object):
         proxy='',
         url_base='',
         info_keys=None,
-        cert=None
+        cert=None,
+        session=None,
+        cert_handler=None
     ):
         if info_keys is None:
             info_keys = {}
@@ -57,6 +60,8 @@ class UrlRequest(object):
         self._proxy = proxy
         self._url_base = url_base
         self._cert = cert
+        self._session = session
+        self._cert_handler = cert_handler  # returns a refreshed certificate
 
         logging.info('SSL certificate: %s', self._cert)
 
@@ -82,10 +87,26 @@ class UrlRequest(object):
         if self._public_key:
             logging.info('Public key: %s', self._public_key)
 
-        self._filename_pattern = '%s.%s' % (
-            utils.get_mfc_computer_name(),
-            utils.get_hardware_uuid()
+        self._filename_pattern = None  # computed in first request
+
+        # requests from several threads (status messages) are serialized
+        self._lock = threading.RLock()
+
+        # status of last request (for scheduler)
+        self.last_http_code = None
+        self.retry_after = None
+
+    def _perform(self, post):
+        _curl = curl.Curl(
+            self._url_base,
+            post,
+            proxy=self._proxy,
+            cert=self._cert,
+            session=self._session,
         )
+        _curl.run()
+
+        return _curl
 
     def run(
         self,
@@ -95,6 +116,10 @@ class UrlRequest(object):
         sign=True,
         exit_on_error=True
     ):
+        with self._lock, timing.instance().span('http', cmd):
+            return self._run(cmd, data, upload_file, sign, exit_on_error)
+
+    def _run(self, cmd, data, upload_file, sign, exit_on_error):
         logging.debug('URL base: %s', self._url_base)
         logging.debug('URL command: %s', cmd)
         logging.debug('URL data: %s', data)
@@ -115,41 +140,48 @@ class UrlRequest(object):
                     }
                 }
 
-        _filename = os.path.join(
-            TMP_PATH,
-            '%s.%s' % (
-                self._filename_pattern,
-                cmd
+        if self._filename_pattern is None:
+            self._filename_pattern = '%s.%s' % (
+                utils.get_mfc_computer_name(),
+                utils.get_hardware_uuid()
             )
-        )
+
+        _filename = '%s.%s' % (self._filename_pattern, cmd)
         if self._debug:
             print(_filename)
         if sign:
-            secure.wrap(
-                _filename,
+            _message = secure.wrap(
                 {cmd: data},
                 key=os.path.join(self._path_keys, self._private_key)
             )
         else:
-            secure.wrap(_filename, {cmd: data})
+            _message = secure.wrap({cmd: data})
 
         _post = [
-            ('message', (pycurl.FORM_FILE, _filename))
+            ('message', (
+                pycurl.FORM_BUFFER, _filename,
+                pycurl.FORM_BUFFERPTR, _message
+            ))
         ]
         if upload_file:
             _post.append(('package', (pycurl.FORM_FILE, upload_file)))
 
         logging.debug('Post data: %s', _post)
 
-        _curl = curl.Curl(
-            self._url_base,
-            _post,
-            proxy=self._proxy,
-            cert=self._cert,
+        _curl = self._perform(_post)
+        if _curl.errno in curl.SSL_ERRORS and self._cert_handler:
+            logging.warning('Server certificate error: %s', _curl.error)
+            _cert = self._cert_handler()
+            if _cert:
+                self._cert = _cert
+                timing.instance().count('http_retries')
+                _curl = self._perform(_post)
+            # else: request fails (never retried without verification)
+
+        self.last_http_code = _curl.http_code if not _curl.error else 0
+        self.retry_after = scheduler.parse_retry_after(
+            _curl.get_header('Retry-After')
         )
-        _curl.run()
-        if not self._debug:
-            os.remove(_filename)
 
         if _curl.error:
             _msg = _('Curl error: %s') % _curl.error
@@ -184,24 +216,13 @@ class UrlRequest(object):
             }
 
         # evaluate response
-        _response = '%s.return' % _filename
-        if sys.version_info[0] < 3:
-            utils.write_file(_response, str(_curl.body))
-        else:
-            utils.write_file(_response, _curl.body)
-
         if sign:
             _ret = secure.unwrap(
-                _response,
+                bytes(_curl.body),
                 key=os.path.join(self._path_keys, self._public_key)
             )
         else:
-            _ret = secure.unwrap(_response)
-
-        if not self._debug:
-            os.remove(_response)
-        else:
-            print(_response)
+            _ret = secure.unwrap(bytes(_curl.body))
 
         if not isinstance(_ret, dict) or not ('%s.return' % cmd) in _ret:
             if 'errmfs' in _ret:
@@ -19,16 +19,15 @@ import os
 import sys
 import subprocess
 import time
-import difflib
 import pwd
 import platform
 import errno
 import re
-import fcntl
 import select
 import uuid
 import signal
 import hashlib
+import threading
 
 if sys.version_info[0] <= 2:
     import commands
@@ -40,7 +39,7 @@ try:
 except ImportError:
     import configparser as ConfigParser
 
-from . import network, settings
+from . import network, timing
 
 import gettext
 _ = gettext.gettext
@@ -99,100 +98,297 @@ def remove_commented_lines(text):
     return '\n'.join(ret)
 
 
-def execute(cmd, verbose=False, interactive=True):
+class _LineTee(object):
+    """
+    Writes stdout lines of a child process to console and/or sink
+    as soon as they are complete
+    """
+
+    def __init__(self, console=True, sink=None):
+        self._console = console
+        self._sink = sink
+        self._pending = b''
+
+    def __call__(self, is_stdout, chunk):
+        if not is_stdout:
+            return
+
+        _lines = (self._pending + chunk).split(b'\n')
+        self._pending = _lines.pop()
+        for _line in _lines:
+            self._write(_line)
+
+    def flush(self):
+        if self._pending:
+            self._write(self._pending)
+            self._pending = b''
+
+    def _write(self, line):
+        if not line:
+            return
+
+        if sys.version_info[0] > 2:
+            line = str(line, encoding='utf8', errors='replace')
+
+        if self._console:
+            print(line)
+        if self._sink:
+            self._sink(line)
+
+
+def execute(cmd, verbose=False, interactive=True, sink=None):
     """
     (int, string, string) execute(
         string cmd,
         bool verbose=False,
-        bool interactive=True
+        bool interactive=True,
+        function sink=None
     )
+    In non interactive mode, stdout and stderr are read at the same time
+    If verbose, stdout lines are printed as they arrive
+    If sink, it is called with every stdout line
     """
 
-    _output_buffer = ''
-
     if verbose:
         print(cmd)
 
+    timing.instance().count('subprocesses')
+
     if interactive:
         _process = subprocess.Popen(
             cmd,
             shell=True,
             executable='/bin/bash'
         )
-    else:
-        _process = subprocess.Popen(
-            cmd,
-            shell=True,
-            executable='/bin/bash',
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE
-        )
+        _process.wait()
+
+        return _process.returncode, None, None
 
-        if verbose:
-            fcntl.fcntl(
-                _process.stdout.fileno(),
-                fcntl.F_SETFL,
-                fcntl.fcntl(
-                    _process.stdout.fileno(),
-                    fcntl.F_GETFL
-                ) | os.O_NONBLOCK,
-            )
-
-            while _process.poll() is None:
-                readx = select.select([_process.stdout.fileno()], [], [])[0]
-                if readx:
-                    chunk = _process.stdout.read()
-                    if isinstance(chunk, bytes) and not isinstance(chunk, str):
-                        chunk = str(chunk, encoding='utf8')
-                    if chunk and chunk != '\n':
-                        print(chunk)
-                    _output_buffer = '%s%s' % (_output_buffer, chunk)
-
-    _output, _error = _process.communicate()
-
-    if not interactive and _output_buffer:
-        _output = _output_buffer
-
-    if isinstance(_output, bytes) and not isinstance(_output, str):
+    _process = subprocess.Popen(
+        cmd,
+        shell=True,
+        executable='/bin/bash',
+        stderr=subprocess.PIPE,
+        stdout=subprocess.PIPE
+    )
+
+    _tee = None
+    if verbose or sink:
+        _tee = _LineTee(console=verbose, sink=sink)
+
+    try:
+        _output, _error, _ = _read_pipes(_process, handler=_tee)
+    finally:
+        _process.stdout.close()
+        _process.stderr.close()
+    _process.wait()
+
+    if _tee:
+        _tee.flush()
+
+    if sys.version_info[0] > 2:
         _output = str(_output, encoding='utf8')
-    if isinstance(_error, bytes) and not isinstance(_error, str):
         _error = str(_error, encoding='utf8')
 
     return _process.returncode, _output, _error
 
 
+def _new_session():
+    """
+    dict _new_session(void)
+    Popen arguments to run the child in its own process group
+    """
+
+    if sys.version_info[0] > 2:
+        return {'start_new_session': True}
+
+    return {'preexec_fn': os.setsid}
+
+
+def _read_pipes(process, timeout=0, handler=None):
+    """
+    (bytes, bytes, bool) _read_pipes(
+        Popen process,
+        int timeout=0,
+        function handler=None
+    )
+    Reads stdout and stderr at the same time until both are closed or
+    timeout (seconds) expires. If handler, it is called with every chunk:
+    handler(bool is_stdout, bytes chunk)
+    Returns (stdout, stderr, expired)
+    """
+
+    _stdout = process.stdout.fileno()
+    _chunks = {_stdout: [], process.stderr.fileno(): []}
+    _deadline = time.time() + timeout if timeout > 0 else None
+
+    _poller = select.poll()
+    for _fd in _chunks:
+        _poller.register(_fd, select.POLLIN | select.POLLPRI)
+    _opened = len(_chunks)
+
+    _expired = False
+    while _opened:
+        _wait = None
+        if _deadline is not None:
+            _wait = _deadline - time.time()
+            if _wait <= 0:
+                _expired = True
+                break
+            _wait = int(_wait * 1000) + 1  # milliseconds
+
+        try:
+            _events = _poller.poll(_wait)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+
+        for _fd, _ in _events:
+            _data = os.read(_fd, 65536)
+            if not _data:  # pipe closed
+                _poller.unregister(_fd)
+                _opened -= 1
+                continue
+
+            _chunks[_fd].append(_data)
+            if handler:
+                handler(_fd == _stdout, _data)
+
+    # child could close its pipes before exiting
+    if not _expired:
+        _expired = not _wait_process(
+            process,
+            _deadline - time.time() if _deadline is not None else None
+        )
+
+    return (
+        b''.join(_chunks[_stdout]),
+        b''.join(_chunks[process.stderr.fileno()]),
+        _expired
+    )
+
+
+def _wait_process(process, timeout=None):
+    """
+    bool _wait_process(Popen process, float timeout=None)
+    Blocks until process exits or timeout (seconds) expires
+    Returns False if timeout expired
+    """
+
+    if timeout is None:
+        process.wait()
+        return True
+
+    if timeout <= 0:
+        return process.poll() is not None
+
+    if sys.version_info[0] > 2:
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False
+
+        return True
+
+    # python 2 Popen.wait has no timeout
+    _deadline = time.time() + timeout
+    while process.poll() is None:
+        if time.time() > _deadline:
+            return False
+        time.sleep(0.01)
+
+    return True
+
+
+def _kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass  # already finished
+
+    process.wait()
+
+
 def timeout_execute(cmd, timeout=60):
-    # based in http://amix.dk/blog/post/19408
+    """
+    (int, string, string) timeout_execute(string cmd, int timeout=60)
+    Returns as soon as cmd exits. If timeout expires, the whole process
+    group of cmd is killed
+    """
 
+    timing.instance().count('subprocesses')
     _process = subprocess.Popen(
         cmd,
         shell=True,
         executable='/bin/bash',
         stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
+        stderr=subprocess.PIPE,
+        **_new_session()
     )
-    if timeout > 0:
-        _seconds_elapsed = 0
-        _interval = 0.2
-        while _process.poll() is None:
-            time.sleep(_interval)
-            _seconds_elapsed += _interval
 
-            if _seconds_elapsed > timeout:
-                os.kill(_process.pid, signal.SIGKILL)
-                os.waitpid(-1, os.WNOHANG)
-                return 1, '', _('"%s" command expired timeout') % cmd
+    try:
+        _output, _error, _expired = _read_pipes(_process, timeout)
+        if _expired:
+            _kill_process_group(_process)
+            return 1, '', _('"%s" command expired timeout') % cmd
+    finally:
+        _process.stdout.close()
+        _process.stderr.close()
 
-    _output, _error = _process.communicate()
+    _process.wait()
 
-    if isinstance(_output, bytes) and not isinstance(_output, str):
+    if sys.version_info[0] > 2:
         _output = str(_output, encoding='utf8')
-    if isinstance(_error, bytes) and not isinstance(_error, str):
         _error = str(_error, encoding='utf8')
 
     return _process.returncode, _output, _error
 
 
+def parallel_map(func, items, workers=1):
+    """
+    list parallel_map(function func, list items, int workers=1)
+    Calls func(item) for every item using a pool of 'workers' threads
+    Returns results in the same order as items
+    If some calls fail, the exception of the first failed item is raised
+    """
+
+    _results = [None] * len(items)
+    _errors = {}  # item index: exception
+    _next = [0]
+    _lock = threading.Lock()
+    _spans = timing.instance().current()
+
+    def _worker():
+        timing.instance().adopt(_spans)
+        while True:
+            with _lock:
+                _index = _next[0]
+                _next[0] += 1
+            if _index >= len(items):
+                return
+
+            try:
+                _results[_index] = func(items[_index])
+            except Exception as e:
+                _errors[_index] = e
+
+    _threads = [
+        threading.Thread(target=_worker)
+        for _ in range(max(1, min(workers, len(items))))
+    ]
+    for _thread in _threads:
+        _thread.daemon = True
+        _thread.start()
+    for _thread in _threads:
+        _thread.join()
+
+    if _errors:
+        raise _errors[min(_errors)]
+
+    return _results
+
+
 def get_hostname():
     """
     string get_hostname(void)
@@ -291,18 +487,16 @@ def get_user_display_graphic(pid, timeout=10, interval=1):
 def compare_lists(a, b):
     """
     list compare_lists(list a, list b)
-    returns ordered diff list
+    returns ordered diff list: '+item' (only in b) and '-item' (only in a)
     """
 
-    _result = list(difflib.unified_diff(a, b, n=0))
-    # clean lines... (only package lines are important)
-    # http://docs.python.org/tutorial/controlflow.html#for-statements
-    for _line in _result[:]:
-        if _line.startswith('+++') or _line.startswith('---') \
-                or _line.startswith('@@'):
-            _result.remove(_line)
+    _a = set(a)
+    _b = set(b)
 
-    return sorted(_result)
+    return sorted(
+        ['+{0}'.format(_item) for _item in _b - _a]
+        + ['-{0}'.format(_item) for _item in _a - _b]
+    )
 
 
 def compare_files(a, b):
@@ -381,6 +575,25 @@ def write_file(filename, content):
             _file.close()
 
 
+def write_file_atomically(filename, content):
+    """
+    bool write_file_atomically(string filename, string content)
+    readers never see a partial file (content is renamed into place)
+    """
+
+    _tmp_file = '{0}.{1}.tmp'.format(filename, os.getpid())
+    if not write_file(_tmp_file, content):
+        return False
+
+    try:
+        os.rename(_tmp_file, filename)
+    except OSError:
+        remove_file(_tmp_file)
+        return False
+
+    return True
+
+
 def remove_file(archive):
     if os.path.isfile(archive):
         os.remove(archive)
@@ -426,36 +639,59 @@ def query_yes_no(question, default="yes"):
             print(_("Please respond with 'yes' or 'no' (or 'y' or 'n')."))
 
 
-def check_lock_file(cmd, lock_file):
+def get_lock_pid(lock_file):
+    """
+    int get_lock_pid(string lock_file)
+    returns pid of the running process that owns lock_file (0 if none)
+    """
+
+    if not os.path.isfile(lock_file):
+        return 0
+
     _pid = 0
+    _file = None
+    try:
+        _file = open(lock_file)
+        _pid = int(_file.read())
+    except (IOError, ValueError):
+        return 0
+    finally:
+        if _file is not None:
+            _file.close()
 
-    if os.path.isfile(lock_file):
-        _file = None
-        try:
-            _file = open(lock_file)
-            _pid = _file.read()
-        except IOError:
-            pass
-        finally:
-            if _file is not None:
-                _file.close()
-
-        if not _pid:
-            _pid = -1
-        else:
-            _pid = int(_pid)
+    try:
+        if os.getsid(_pid):
+            return _pid
+    except OSError:
+        pass
+
+    return 0
 
-        try:
-            if os.getsid(_pid):
-                print(_('Another instance of %(cmd)s is running: %(pid)d') % {
-                    'cmd': cmd,
-                    'pid': int(_pid)
-                })
-                sys.exit(errno.EPERM)
-        except OSError:
-            pass
-    else:
-        write_file(lock_file, str(os.getpid()))
+
+def acquire_lock_file(lock_file):
+    """
+    bool acquire_lock_file(string lock_file)
+    returns False if another process owns lock_file
+    """
+
+    if get_lock_pid(lock_file):
+        return False
+
+    write_file(lock_file, str(os.getpid()))
+
+    return True
+
+
+def check_lock_file(cmd, lock_file):
+    _pid = get_lock_pid(lock_file)
+    if _pid:
+        print(_('Another instance of %(cmd)s is running: %(pid)d') % {
+            'cmd': cmd,
+            'pid': _pid
+        })
+        sys.exit(errno.EPERM)
+
+    write_file(lock_file, str(os.getpid()))
 
 
 def get_current_user():
@@ -513,17 +749,9 @@ def get_distro_major_version():
 
 
 def get_mfc_project():
-    _config = get_config(settings.CONF_FILE, 'client')
+    from . import config
 
-    if isinstance(_config, dict) and 'project' in _config:
-        return _config.get('project')
-
-    # backwards compatibility
-    if isinstance(_config, dict) and 'version' in _config:
-        return _config.get('version')
-
-    # if not set
-    return get_distro_project()
+    return config.instance().project
 
 
 def get_mfc_version():
@@ -532,14 +760,77 @@ def get_mfc_version():
 
 
 def get_mfc_computer_name():
-    _config = get_config(settings.CONF_FILE, 'client')
-    if isinstance(_config, dict) and 'computer_name' in _config:
-        return _config.get('computer_name')
+    from . import config
+
+    return config.instance().computer_name
+
+
+def get_boot_id():
+    """
+    string get_boot_id(void)
+    changes in every boot
+    """
+
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as _fp:
+            return _fp.read().strip()
+    except IOError:
+        return ''
 
-    return get_hostname()  # if not set
+
+_identity_lock = threading.RLock()  # func can read other identity keys
+
+
+def _load_identity():
+    from . import cache
+
+    _boot_id = get_boot_id()
+    _data = cache.load('identity', {})
+    if _data.get('boot_id') != _boot_id:
+        _data = {'boot_id': _boot_id}
+
+    return _data
+
+
+def _identity(key, func):
+    """
+    value _identity(string key, function func)
+    value returned by func is cached until next boot
+    """
+
+    from . import cache
+
+    with _identity_lock:
+        _data = _load_identity()
+        if key in _data:
+            return _data[key]
+
+        _value = func()
+
+        # nested calls (inside func) could have saved other keys
+        _data = _load_identity()
+        _data[key] = _value
+        cache.save('identity', _data)
+
+        return _value
+
+
+def refresh_identity():
+    """
+    void refresh_identity(void)
+    hardware identity will be read again
+    """
+
+    from . import cache
+
+    cache.remove('identity')
 
 
 def get_smbios_version():
+    return tuple(_identity('smbios', _read_smbios_version))
+
+
+def _read_smbios_version():
     # issue #33
     _ret, _smbios, _ = execute(
         'LC_ALL=C sudo dmidecode -t 0 | grep SMBIOS | grep present',
@@ -552,11 +843,24 @@ def get_smbios_version():
     return tuple(int(x) for x in _smbios.split('.'))
 
 
+def get_first_mac():
+    return _identity('mac', network.get_first_mac)
+
+
 def get_uuid_from_mac():
-    return "00000000-0000-0000-0000-{0}".format(network.get_first_mac())
+    return "00000000-0000-0000-0000-{0}".format(get_first_mac())
 
 
 def get_hardware_uuid():
+    """
+    string get_hardware_uuid(void)
+    dmidecode is only executed once per boot (see refresh_identity)
+    """
+
+    return _identity('uuid', _read_hardware_uuid)
+
+
+def _read_hardware_uuid():
     _uuid_format = '%s%s%s%s-%s%s-%s%s-%s-%s'
 
     # issue #16, issue #28
@@ -622,13 +926,33 @@ def cast_to_bool(value, default=False):
     return default
 
 
+def cast_to_int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
 def is_xsession():
     return os.environ.get('DISPLAY') is not None
 
 
+def which(cmd):
+    """
+    string which(string cmd)
+    returns full path of cmd (searched in PATH) or None
+    """
+
+    for _path in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        _file = os.path.join(_path, cmd)
+        if os.path.isfile(_file) and os.access(_file, os.X_OK):
+            return _file
+
+    return None
+
+
 def is_zenity():
-    _ret, _, _ = execute('which zenity', interactive=False)
-    return _ret == 0
+    return which('zenity') is not None
 
 
 def get_mfc_release():
@@ -637,6 +961,17 @@ def get_mfc_release():
     return __version__
 
 
+def sha1sum(content):
+    """
+    string sha1sum(string content)
+    """
+
+    if sys.version_info[0] > 2 and not isinstance(content, bytes):
+        content = content.encode()
+
+    return hashlib.sha1(content).hexdigest()
+
+
 def md5sum(archive):
     if not archive:
         return ''
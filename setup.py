@@ -143,6 +143,7 @@ setup(
         'bin/migasfree-upload',
         'bin/migasfree-label',
         'bin/migasfree-tags',
+        'bin/migasfree-agent',
     ],
     # http://pypi.python.org/pypi?%3Aaction=list_classifiers
     classifiers=[
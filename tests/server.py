@@ -0,0 +1,147 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Local stand-ins of migasfree server (unsigned messages) and of
+repositories (static files), listening in loopback
+"""
+
+import json
+import threading
+
+from email.parser import BytesParser
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+
+def _form_fields(content_type, body):
+    """
+    dict _form_fields(string content_type, bytes body)
+    multipart/form-data fields: {name: bytes}
+    """
+
+    _message = BytesParser().parsebytes(
+        b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body
+    )
+
+    return dict(
+        (_part.get_param('name', header='content-disposition'),
+         _part.get_payload(decode=True))
+        for _part in _message.get_payload()
+    )
+
+
+class StandInServer(object):
+    """
+    handler(string cmd, data, dict fields) returns
+    (int http_code, dict headers, response): response is returned to
+    client as '<cmd>.return' (or as is if it is bytes)
+    Received requests are recorded as (cmd, data) in requests
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+        _server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                _fields = _form_fields(
+                    self.headers['Content-Type'],
+                    self.rfile.read(int(self.headers['Content-Length']))
+                )
+                _message = json.loads(_fields['message'].decode('utf8'))
+                _cmd, _data = list(_message.items())[0]
+                _server.requests.append((_cmd, _data))
+
+                _code, _headers, _response = _server.handler(
+                    _cmd, _data, _fields
+                )
+                if not isinstance(_response, bytes):
+                    _response = json.dumps(
+                        {'{0}.return'.format(_cmd): _response}
+                    ).encode('utf8')
+
+                self.send_response(_code)
+                for _key, _value in _headers.items():
+                    self.send_header(_key, _value)
+                self.send_header('Content-Length', str(len(_response)))
+                self.end_headers()
+                self.wfile.write(_response)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = HTTPServer(('127.0.0.1', 0), _Handler)
+        self.url = 'http://127.0.0.1:{0}/'.format(self._httpd.server_port)
+
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class StaticServer(object):
+    """
+    Serves files: {path: bytes}
+    Number of GET requests of each path are counted in hits
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.hits = {}
+
+        _server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                _path = self.path.split('?')[0]
+                _server.hits[_path] = _server.hits.get(_path, 0) + 1
+                if _path not in _server.files:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header(
+                    'Content-Length', str(len(_server.files[_path]))
+                )
+                self.end_headers()
+                self.wfile.write(_server.files[_path])
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = HTTPServer(('127.0.0.1', 0), _Handler)
+        self.address = '127.0.0.1:{0}'.format(self._httpd.server_port)
+
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,118 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Installed, removed and upgraded packages between inventories
+(python -m unittest discover tests)
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from migasfree_client.backends import apt, dpkg_status, zypper
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+STATUS = '''Package: dpkg
+Status: install ok installed
+Architecture: amd64
+Version: 1.19.7
+
+Package: libgtk-3-0
+Status: install ok installed
+Architecture: amd64
+Multi-Arch: same
+Version: 3.24.5-1
+
+Package: libgtk-3-bin
+Status: install ok installed
+Architecture: amd64
+Version: 3.24.5-1
+
+Package: vim
+Status: install ok installed
+Architecture: amd64
+Version: 2:8.1.0875-5
+
+'''
+
+
+class AptChangesTestCase(unittest.TestCase):
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        self._status_file = dpkg_status.STATUS_FILE
+        dpkg_status.STATUS_FILE = os.path.join(self._path, 'status')
+        with open(dpkg_status.STATUS_FILE, 'w') as _fp:
+            _fp.write(STATUS)
+
+        self.pms = apt.Apt()
+
+    def tearDown(self):
+        dpkg_status.STATUS_FILE = self._status_file
+        shutil.rmtree(self._path)
+
+    def test_changes(self):
+        _before = [
+            'dpkg-1.19.7',
+            'libgtk-3-0:amd64-3.24.4-2',
+            'nano-3.2-3',
+        ]
+        _after = self.pms.query_all()
+
+        self.assertEqual(self.pms.changes(_before, _after), (
+            ['libgtk-3-bin-3.24.5-1', 'vim-2:8.1.0875-5'],
+            ['nano-3.2-3'],
+            ['libgtk-3-0:amd64-3.24.5-1'],
+        ))
+
+    def test_no_changes(self):
+        _packages = self.pms.query_all()
+
+        self.assertEqual(self.pms.changes(_packages, _packages), ([], [], []))
+
+
+class RpmChangesTestCase(unittest.TestCase):
+    def test_changes(self):
+        _before = [
+            'bash-4.4-9.10.1.x86_64',
+            'kernel-default-4.12.14-lp151.28.4.1.x86_64',
+            'kernel-default-4.12.14-lp151.28.7.1.x86_64',
+            'libgtk-3-0-3.24.4-1.1.x86_64',
+        ]
+        _after = [
+            'bash-4.4-9.10.1.x86_64',
+            'kernel-default-4.12.14-lp151.28.7.1.x86_64',
+            'kernel-default-4.12.14-lp151.28.10.1.x86_64',
+            'libgtk-3-0-3.24.5-1.1.x86_64',
+            'libgtk-3-bin-3.24.5-1.1.x86_64',
+        ]
+
+        self.assertEqual(zypper.Zypper().changes(_before, _after), (
+            ['libgtk-3-bin-3.24.5-1.1.x86_64'],
+            [],
+            [
+                'kernel-default-4.12.14-lp151.28.10.1.x86_64',
+                'libgtk-3-0-3.24.5-1.1.x86_64',
+            ],
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
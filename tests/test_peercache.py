@@ -0,0 +1,269 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+LAN peer cache: several peer cache processes in loopback sharing packages
+of a stand-in repository
+(python -m unittest discover tests)
+"""
+
+import os
+import sys
+import time
+import shutil
+import socket
+import hashlib
+import tempfile
+import unittest
+import subprocess
+
+try:
+    from urllib2 import urlopen, HTTPError
+except ImportError:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+
+from migasfree_client import peercache, settings
+
+from server import StaticServer
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+PROJECT = 'project'
+
+# peer cache process: argv = cache path, port, server, peers...
+# (runs until its stdin is closed)
+PEER_PROCESS = '''
+import sys
+from migasfree_client import settings
+settings.CACHE_PATH = sys.argv[1]
+from migasfree_client import peercache
+_cache = peercache.PeerCache(
+    int(sys.argv[2]), 'http://', sys.argv[3], 'project',
+    peers=sys.argv[4:], path=sys.argv[1] + '/packages'
+)
+_cache.start()
+sys.stdout.write('ready\\n')
+sys.stdout.flush()
+sys.stdin.read()
+_cache.stop()
+'''
+
+
+def _sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def _free_port():
+    _socket = socket.socket()
+    _socket.bind(('127.0.0.1', 0))
+    _port = _socket.getsockname()[1]
+    _socket.close()
+
+    return _port
+
+
+def repository(packages):
+    """
+    dict repository(dict packages)
+    Debian repository files ({path: bytes}) with packages ({name: bytes})
+    """
+
+    _base = '/public/{0}'.format(PROJECT)
+    _files = {}
+    _index = ''
+    for _name, _content in sorted(packages.items()):
+        _filename = 'pool/main/{0}_1.0_all.deb'.format(_name)
+        _files['{0}/{1}'.format(_base, _filename)] = _content
+        _index += 'Package: {0}\nFilename: {1}\nSHA256: {2}\n\n'.format(
+            _name, _filename, _sha256(_content)
+        )
+
+    _index = _index.encode()
+    _files[_base + '/dists/stable/main/binary-all/Packages'] = _index
+    _files[_base + '/dists/stable/Release'] = (
+        'Origin: test\nSHA256:\n {0} {1} main/binary-all/Packages\n'.format(
+            _sha256(_index), len(_index)
+        )
+    ).encode()
+
+    return _files
+
+
+class PeerProcessesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.packages = {'hello': b'hello package' * 1000, 'bye': b'bye' * 10}
+        self.upstream = StaticServer(repository(self.packages))
+        self._path = tempfile.mkdtemp()
+        self._processes = []
+
+    def tearDown(self):
+        for _process in self._processes:
+            _process.stdin.close()
+            _process.wait()
+            _process.stdout.close()
+        self.upstream.stop()
+        shutil.rmtree(self._path)
+
+    def _peer(self, name, peers=None):
+        _port = _free_port()
+        _path = os.path.join(self._path, name)
+        os.mkdir(_path)
+
+        _process = subprocess.Popen(
+            [sys.executable, '-c', PEER_PROCESS, _path, str(_port),
+             self.upstream.address] + (peers or []),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+        self._processes.append(_process)
+        self.assertEqual(_process.stdout.readline().strip(), b'ready')
+
+        return _port
+
+    def _get(self, port, path):
+        _response = urlopen('http://127.0.0.1:{0}{1}'.format(port, path))
+        try:
+            return _response.read()
+        finally:
+            _response.close()
+
+    def _apt_update(self, port):
+        _base = '/{0}/public/{1}/dists/stable'.format(
+            self.upstream.address, PROJECT
+        )
+        self._get(port, _base + '/Release')
+        self._get(port, _base + '/main/binary-all/Packages')
+
+    def _deb(self, name):
+        return '/{0}/public/{1}/pool/main/{2}_1.0_all.deb'.format(
+            self.upstream.address, PROJECT, name
+        )
+
+    def _upstream_path(self, name):
+        return '/public/{0}/pool/main/{1}_1.0_all.deb'.format(PROJECT, name)
+
+    def _upstream_hits(self, name):
+        return self.upstream.hits.get(self._upstream_path(name), 0)
+
+    def _assert_package(self, port, name):
+        self.assertEqual(self._get(port, self._deb(name)), self.packages[name])
+
+    def test_package_from_peer(self):
+        _first = self._peer('first')
+        _second = self._peer('second', ['127.0.0.1:{0}'.format(_first)])
+
+        self._apt_update(_first)
+        self._assert_package(_first, 'hello')
+        self.assertEqual(self._upstream_hits('hello'), 1)
+
+        self._apt_update(_second)
+        self._assert_package(_second, 'hello')
+        self.assertEqual(self._upstream_hits('hello'), 1)  # from first peer
+
+        # first peer keeps its stored copy
+        self._assert_package(_first, 'hello')
+        self.assertEqual(self._upstream_hits('hello'), 1)
+
+    def test_wrong_content_of_peer(self):
+        _hash = _sha256(self.packages['hello'])
+        _bad_peer = StaticServer({'/sha256/' + _hash: b'tampered'})
+        try:
+            _port = self._peer('victim', [_bad_peer.address])
+            self._apt_update(_port)
+
+            self._assert_package(_port, 'hello')
+            self.assertEqual(_bad_peer.hits['/sha256/' + _hash], 1)
+            self.assertEqual(self._upstream_hits('hello'), 1)
+        finally:
+            _bad_peer.stop()
+
+    def test_tampered_package_in_upstream(self):
+        _port = self._peer('first')
+        self._apt_update(_port)
+        self.upstream.files[self._upstream_path('bye')] = b'evil'
+
+        with self.assertRaises(HTTPError) as _context:
+            self._get(_port, self._deb('bye'))
+        self.assertEqual(_context.exception.code, 502)
+
+    def test_only_repositories_of_project(self):
+        _port = self._peer('first')
+
+        for _path in [
+            '/{0}/public/other/pool/main/hello_1.0_all.deb'.format(
+                self.upstream.address
+            ),
+            '/example.com/public/{0}/pool/main/hello_1.0_all.deb'.format(
+                PROJECT
+            ),
+            '/{0}/public/{1}/../other/x.deb'.format(
+                self.upstream.address, PROJECT
+            ),
+        ]:
+            with self.assertRaises(HTTPError) as _context:
+                self._get(_port, _path)
+            self.assertEqual(_context.exception.code, 404)
+
+
+class IndexLockTestCase(unittest.TestCase):
+    def setUp(self):
+        self._cache_path = settings.CACHE_PATH
+        settings.CACHE_PATH = tempfile.mkdtemp()
+        self._parse_metadata = peercache.parse_metadata
+
+    def tearDown(self):
+        peercache.parse_metadata = self._parse_metadata
+        shutil.rmtree(settings.CACHE_PATH)
+        settings.CACHE_PATH = self._cache_path
+
+    def test_indexes_are_parsed_without_lock(self):
+        _cache = peercache.PeerCache(0, 'http://', 'server', PROJECT)
+        _locked = []
+
+        def _parse(path, content):
+            _locked.append(_cache._lock.locked())
+            return self._parse_metadata(path, content)
+
+        peercache.parse_metadata = _parse
+
+        _files = repository({'hello': b'hello'})
+        for _path in [
+            '/public/project/dists/stable/Release',
+            '/public/project/dists/stable/main/binary-all/Packages',
+        ]:
+            _filename = os.path.join(settings.CACHE_PATH, 'index')
+            with open(_filename, 'wb') as _fp:
+                _fp.write(_files[_path])
+            _cache._index_metadata(
+                '/server' + _path, _filename, _sha256(_files[_path])
+            )
+
+        self.assertEqual(_locked, [False, False])
+        with _cache._lock:
+            self.assertEqual(
+                _cache._package_sha256(
+                    '/server/public/project/pool/main/hello_1.0_all.deb'
+                ),
+                _sha256(b'hello')
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Scheduler backoff with responses of a stand-in server
+(python -m unittest discover tests)
+"""
+
+import time
+import shutil
+import socket
+import tempfile
+import unittest
+
+from migasfree_client import scheduler, settings, url_request
+
+from server import StandInServer
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self._cache_path = settings.CACHE_PATH
+        settings.CACHE_PATH = tempfile.mkdtemp()
+        self.server = None
+
+    def tearDown(self):
+        if self.server:
+            self.server.stop()
+        shutil.rmtree(settings.CACHE_PATH)
+        settings.CACHE_PATH = self._cache_path
+
+    def _request(self, url):
+        _request = url_request.UrlRequest(url_base=url)
+        _request._filename_pattern = 'test.uuid'  # no hardware identity
+        _request.run('get_properties', sign=False, exit_on_error=False)
+
+        return _request
+
+    def _record(self, request, scheduler_):
+        # as MigasFreeClient._record_sync
+        if scheduler.is_overloaded(request.last_http_code):
+            scheduler_.failed(request.retry_after)
+        elif scheduler.is_unreachable(request.last_http_code):
+            scheduler_.unreachable()
+        else:
+            scheduler_.succeeded()
+
+        return scheduler_.deferred()
+
+    def test_overloaded_server(self):
+        self.server = StandInServer(
+            lambda cmd, data, fields: (503, {'Retry-After': '120'}, b'busy')
+        )
+        _scheduler = scheduler.Scheduler(backoff_max=21600)
+
+        _delays = []
+        for _ in range(6):
+            _request = self._request(self.server.url)
+            self.assertEqual(_request.last_http_code, 503)
+            self.assertEqual(_request.retry_after, 120)
+            _delays.append(self._record(_request, _scheduler))
+
+        # Retry-After is a floor, backoff grows until backoff_max
+        self.assertTrue(all(_delay >= 119 for _delay in _delays), _delays)
+        self.assertGreater(_delays[-1], 60 * 2 ** 5 / 2 - 1)
+        self.assertEqual(_scheduler.state['failures'], 6)
+
+        # state is shared through cache
+        self.assertGreater(scheduler.Scheduler().deferred(), 119)
+
+    def test_unreachable_server(self):
+        _socket = socket.socket()
+        _socket.bind(('127.0.0.1', 0))  # nobody listening
+        _url = 'http://127.0.0.1:{0}/'.format(_socket.getsockname()[1])
+        _socket.close()
+
+        _scheduler = scheduler.Scheduler(backoff_max=21600)
+        for _ in range(10):
+            _request = self._request(_url)
+            self.assertEqual(_request.last_http_code, scheduler.NETWORK_ERROR)
+            _delay = self._record(_request, _scheduler)
+
+        self.assertLessEqual(_delay, scheduler.Scheduler.UNREACHABLE_MAX)
+        self.assertEqual(_scheduler.state['failures'], 0)
+        self.assertEqual(_scheduler.state['network_failures'], 10)
+
+    def test_success_resets_backoff(self):
+        _responses = [
+            (503, {}, b'busy'),
+            (200, {}, {'properties': []}),
+        ]
+        self.server = StandInServer(
+            lambda cmd, data, fields: _responses.pop(0)
+        )
+        _scheduler = scheduler.Scheduler()
+
+        self.assertGreater(
+            self._record(self._request(self.server.url), _scheduler), 0
+        )
+        self.assertEqual(
+            self._record(self._request(self.server.url), _scheduler), 0
+        )
+        self.assertEqual(self.server.requests[-1], ('get_properties', ''))
+        self.assertLess(
+            abs(_scheduler.state['last_sync'] - time.time()), 5
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Software base upload of reference computers against a stand-in server
+(python -m unittest discover tests)
+"""
+
+import sys
+import shutil
+import tempfile
+import unittest
+
+from migasfree_client import cache, server_errors, settings, url_request
+
+# command module reopens stdout and stderr unbuffered: test runner streams
+# are restored and reopened ones are kept (their fds are closed when freed)
+_streams = sys.stdout, sys.stderr
+from migasfree_client.client import MigasFreeClient
+_unbuffered = sys.stdout, sys.stderr
+sys.stdout, sys.stderr = _streams
+
+from server import StandInServer
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+
+class ReferenceServer(object):
+    """
+    Keeps software base of a reference computer (versioned)
+    delta_supported=False emulates servers without delta command
+    """
+
+    def __init__(self, delta_supported=True):
+        self.delta_supported = delta_supported
+        self.version = 0
+        self.base = set()
+
+    def __call__(self, cmd, data, fields):
+        if cmd == 'upload_computer_software_base':
+            self.base = set(data.split('\n'))
+            self.version += 1
+
+            return 200, {}, {'version': self.version}
+
+        if cmd == 'upload_computer_software_base_delta':
+            if not self.delta_supported:
+                return 200, {}, {'errmfs': {
+                    'code': server_errors.COMMAND_NOT_FOUND, 'info': cmd
+                }}
+            if data['version'] != self.version:
+                return 200, {}, {'errmfs': {
+                    'code': server_errors.GENERIC, 'info': 'version mismatch'
+                }}
+
+            for _item in data['delta'].split('\n'):
+                if _item.startswith('+'):
+                    self.base.add(_item[1:])
+                else:
+                    self.base.discard(_item[1:])
+            self.version += 1
+
+            return 200, {}, {'version': self.version}
+
+        return 404, {}, b'not found'
+
+
+class SoftwareBaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self._cache_path = settings.CACHE_PATH
+        settings.CACHE_PATH = tempfile.mkdtemp()
+        self.server = None
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(settings.CACHE_PATH)
+        settings.CACHE_PATH = self._cache_path
+
+    def _client(self, reference):
+        self.reference = reference
+        self.server = StandInServer(reference)
+
+        _client = MigasFreeClient.__new__(MigasFreeClient)  # no environment
+        _client._url_request = url_request.UrlRequest(url_base=self.server.url)
+        _client._url_request._filename_pattern = 'test.uuid'
+        _client._url_request._sign = False
+        _run = _client._url_request.run
+        _client._url_request.run = \
+            lambda cmd, **kwargs: _run(cmd, sign=False, **kwargs)
+
+        return _client
+
+    def _commands(self):
+        return [_cmd for _cmd, _ in self.server.requests]
+
+    def test_delta_upload(self):
+        _client = self._client(ReferenceServer())
+
+        _client._upload_software_base(['a-1', 'b-1', 'c-1'])
+        _client._upload_software_base(['a-1', 'b-2', 'c-1', 'd-1'])
+        _client._upload_software_base(['a-1', 'b-2', 'c-1', 'd-1'])
+
+        self.assertEqual(self._commands(), [
+            'upload_computer_software_base',
+            'upload_computer_software_base_delta',
+        ])
+        self.assertEqual(
+            self.server.requests[1][1],
+            {'version': 1, 'delta': '+b-2\n+d-1\n-b-1'}
+        )
+        self.assertEqual(self.reference.base, set(['a-1', 'b-2', 'c-1', 'd-1']))
+        self.assertEqual(cache.load('software_reference')['version'], 2)
+
+    def test_full_upload_when_delta_is_rejected(self):
+        _client = self._client(ReferenceServer())
+
+        _client._upload_software_base(['a-1', 'b-1'])
+        self.reference.version = 5  # base changed in server (other client)
+        _client._upload_software_base(['a-1', 'b-2'])
+
+        self.assertEqual(self._commands(), [
+            'upload_computer_software_base',
+            'upload_computer_software_base_delta',
+            'upload_computer_software_base',
+        ])
+        self.assertEqual(self.reference.base, set(['a-1', 'b-2']))
+        self.assertEqual(cache.load('software_reference')['version'], 6)
+
+    def test_full_upload_to_server_without_delta(self):
+        _client = self._client(ReferenceServer(delta_supported=False))
+
+        _client._upload_software_base(['a-1'])
+        _client._upload_software_base(['a-1', 'b-1'])
+
+        self.assertEqual(self._commands(), [
+            'upload_computer_software_base',
+            'upload_computer_software_base_delta',
+            'upload_computer_software_base',
+        ])
+        self.assertEqual(self.reference.base, set(['a-1', 'b-1']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Span counters of concurrent threads
+(python -m unittest discover tests)
+"""
+
+import threading
+import unittest
+
+from migasfree_client import timing, utils
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+
+class TracerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tracer = timing.instance()
+        self.tracer.reset()
+
+    def _span(self, name):
+        return [
+            _span for _span in self.tracer.report()['spans']
+            if _span['name'] == name
+        ][0]
+
+    def test_concurrent_spans(self):
+        _started = threading.Event()
+        _counted = threading.Event()
+
+        def _background():
+            with self.tracer.span('phase', 'background'):
+                _started.set()
+                self.tracer.count('bytes_received', 1000)
+                self.tracer.count('subprocesses')
+                _counted.wait()
+
+        _thread = threading.Thread(target=_background)
+        with self.tracer.span('phase', 'main'):
+            _thread.start()
+            _started.wait()
+            self.tracer.count('bytes_received', 10)
+            _counted.set()
+            _thread.join()
+
+        self.assertEqual(self._span('main')['bytes_received'], 10)
+        self.assertEqual(self._span('main')['subprocesses'], 0)
+        self.assertEqual(self._span('background')['bytes_received'], 1000)
+        self.assertEqual(self._span('background')['subprocesses'], 1)
+        self.assertEqual(self.tracer.counters['bytes_received'], 1010)
+
+    def test_nested_spans(self):
+        with self.tracer.span('phase', 'outer'):
+            self.tracer.count('bytes_sent', 1)
+            with self.tracer.span('http', 'inner'):
+                self.tracer.count('bytes_sent', 2)
+
+        self.assertEqual(self._span('outer')['bytes_sent'], 3)
+        self.assertEqual(self._span('inner')['bytes_sent'], 2)
+
+    def test_parallel_map_workers_count_in_caller_span(self):
+        with self.tracer.span('phase', 'attributes'):
+            utils.parallel_map(
+                lambda _item: self.tracer.count('subprocesses'),
+                range(8),
+                workers=4
+            )
+
+        self.assertEqual(self._span('attributes')['subprocesses'], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
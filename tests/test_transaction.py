@@ -0,0 +1,258 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Package transactions of backends against simulated package managers
+(python -m unittest discover tests)
+"""
+
+import unittest
+
+from migasfree_client.backends import apt, zypper
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+
+class FakeSystem(object):
+    """
+    Installed packages and a repository with dependencies and conflicts
+    Package managers are emulated by execute(cmd, ...)
+    """
+
+    def __init__(self, installed, available, requires=None, conflicts=None):
+        self.installed = set(installed)
+        self.available = set(available)
+        self.requires = requires or {}  # {package: [required packages]}
+        self.conflicts = conflicts or {}  # {package: [conflicting packages]}
+        self.upgraded = False
+        self.commands = []
+
+    def dependents(self, packages):
+        _result = set()
+        for _pkg in self.installed - set(packages):
+            if set(self.requires.get(_pkg, [])) & set(packages):
+                _result.add(_pkg)
+
+        return _result
+
+    def change(self, remove, install, force=True, download=False):
+        """
+        (int, string) change(list remove, list install, bool force=True, ...)
+        force: conflicting installed packages are removed
+        """
+
+        _unknown = [_pkg for _pkg in install if _pkg not in self.available]
+        if _unknown:
+            return 100, 'Unable to locate package {0}'.format(_unknown[0])
+
+        _conflicts = set()
+        for _pkg in install:
+            _conflicts |= set(self.conflicts.get(_pkg, [])) & self.installed
+        _conflicts -= set(remove)
+        if _conflicts and not force:
+            return 4, 'Problem: conflicts with {0}'.format(sorted(_conflicts))
+
+        if not download:
+            _remove = set(remove) | _conflicts
+            self.installed -= _remove | self.dependents(_remove)
+            self.installed |= set(install)
+
+        return 0, ''
+
+
+class FakeApt(FakeSystem):
+    def execute(self, cmd, verbose=False, interactive=True, sink=None):
+        self.commands.append(cmd)
+        _args = cmd.split()
+
+        if '--compare-versions' in _args:  # apt >= 1.1
+            return 0, '', ''
+
+        if '--show' in _args:  # installed_set
+            return 0, ''.join(
+                '{0} amd64 install ok installed\n'.format(_pkg)
+                for _pkg in _args[4:] if _pkg in self.installed
+            ), ''
+
+        if 'purge' in _args:
+            _ret, _error = self.change(_args[_args.index('purge') + 1:], [])
+            return _ret, '', _error
+
+        for _command in ['dist-upgrade', 'install']:
+            if _command in _args:
+                _packages = _args[_args.index(_command) + 1:]
+                break
+        else:
+            return 0, '', ''
+
+        _ret, _error = self.change(
+            [_pkg[:-1] for _pkg in _packages if _pkg.endswith('-')],
+            [_pkg for _pkg in _packages if not _pkg.endswith('-')],
+            download='--download-only' in _args
+        )
+        if _ret == 0 and _command == 'dist-upgrade':
+            self.upgraded = True
+
+        return _ret, '', _error
+
+
+class FakeZypper(FakeSystem):
+    def execute(self, cmd, verbose=False, interactive=True, sink=None):
+        self.commands.append(cmd)
+        _args = cmd.split()
+
+        if '-q' in _args:  # rpm query (installed_set)
+            return 0, '\n'.join(
+                'package {0} is not installed'.format(_pkg)
+                for _pkg in _args[_args.index('-q') + 1:]
+                if _pkg not in self.installed
+            ), ''
+
+        if 'update' in _args:
+            self.upgraded = True
+            return 0, '', ''
+
+        if 'remove' in _args:
+            _ret, _error = self.change(_args[_args.index('remove') + 1:], [])
+            return _ret, _error, ''
+
+        if 'install' in _args:
+            _packages = [
+                _pkg for _pkg in _args[_args.index('install') + 1:]
+                if not _pkg.startswith('-')
+            ]
+            _ret, _error = self.change(
+                [], _packages,
+                force='--force-resolution' in _args,
+                download='--download-only' in _args
+            )
+            return _ret, _error, ''
+
+        return 0, '', ''
+
+
+class BackendTestCase(unittest.TestCase):
+    module = None
+
+    def setUp(self):
+        self._execute = self.module.execute
+
+    def tearDown(self):
+        self.module.execute = self._execute
+
+    def _pms(self, pms_class, system):
+        self.system = system
+        self.module.execute = system.execute
+
+        return pms_class()
+
+
+class AptTestCase(BackendTestCase):
+    module = apt
+
+    def _system(self):
+        return FakeApt(
+            installed=['libfoo', 'app', 'old'],
+            available=['libfoo', 'app', 'old', 'new', 'tool']
+        )
+
+    def test_one_transaction(self):
+        _pms = self._pms(apt.Apt, self._system())
+
+        _ret, _error = _pms.transaction(['old'], ['new'], upgrade=True)
+
+        self.assertTrue(_ret, _error)
+        self.assertEqual(self.system.installed, set(['libfoo', 'app', 'new']))
+        self.assertTrue(self.system.upgraded)
+        self.assertEqual(
+            len([_cmd for _cmd in self.system.commands if 'apt-get' in _cmd]),
+            1
+        )
+
+    def test_unknown_package_does_not_block_upgrade(self):
+        _pms = self._pms(apt.Apt, self._system())
+
+        _ret, _error = _pms.transaction(
+            ['old'], ['new', 'misspelled'], upgrade=True
+        )
+
+        self.assertFalse(_ret)
+        self.assertIn('misspelled', _error)
+        self.assertTrue(self.system.upgraded)
+        self.assertNotIn('old', self.system.installed)
+
+
+class ZypperTestCase(BackendTestCase):
+    module = zypper
+
+    def test_remove_package_with_dependents(self):
+        _pms = self._pms(zypper.Zypper, FakeZypper(
+            installed=['libfoo', 'app', 'bash'],
+            available=['libfoo', 'app', 'bash', 'new'],
+            requires={'app': ['libfoo']}
+        ))
+
+        _ret, _error = _pms.transaction(['libfoo'], ['new'])
+
+        self.assertTrue(_ret, _error)
+        self.assertEqual(self.system.installed, set(['bash', 'new']))
+
+    def test_install_does_not_remove_conflicting_packages(self):
+        _pms = self._pms(zypper.Zypper, FakeZypper(
+            installed=['libfoo', 'postfix'],
+            available=['libfoo', 'postfix', 'sendmail'],
+            conflicts={'sendmail': ['postfix']}
+        ))
+
+        _ret, _error = _pms.transaction(['libfoo'], ['sendmail'])
+
+        self.assertFalse(_ret)
+        self.assertIn('conflicts', _error)
+        self.assertEqual(self.system.installed, set(['postfix']))
+        self.assertFalse(
+            [_cmd for _cmd in self.system.commands
+             if '--force-resolution' in _cmd]
+        )
+
+    def test_prefetch_does_not_remove_conflicting_packages(self):
+        _pms = self._pms(zypper.Zypper, FakeZypper(
+            installed=['libfoo', 'postfix'],
+            available=['libfoo', 'postfix', 'sendmail'],
+            conflicts={'sendmail': ['postfix']}
+        ))
+
+        _ret, _ = _pms.prefetch(['libfoo'], ['sendmail'])
+
+        self.assertFalse(_ret)
+        self.assertEqual(self.system.installed, set(['libfoo', 'postfix']))
+
+    def test_unknown_package_does_not_block_upgrade(self):
+        _pms = self._pms(zypper.Zypper, FakeZypper(
+            installed=['bash'],
+            available=['bash', 'new']
+        ))
+
+        _ret, _error = _pms.transaction([], ['new', 'misspelled'], upgrade=True)
+
+        self.assertFalse(_ret)
+        self.assertIn('misspelled', _error)
+        self.assertTrue(self.system.upgraded)
+
+
+if __name__ == '__main__':
+    unittest.main()
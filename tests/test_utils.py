@@ -0,0 +1,116 @@
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+utils helpers
+(python -m unittest discover tests)
+"""
+
+import time
+import shutil
+import tempfile
+import unittest
+
+from migasfree_client import settings, utils
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+
+class ParallelMapTestCase(unittest.TestCase):
+    def test_results_in_input_order(self):
+        self.assertEqual(
+            utils.parallel_map(lambda x: x * 2, [3, 1, 2], workers=3),
+            [6, 2, 4]
+        )
+
+    def test_first_error_in_input_order(self):
+        def _func(item):
+            if item == 'slow':
+                time.sleep(0.2)  # fails after 'fast'
+                raise KeyError(item)
+            if item == 'fast':
+                raise ValueError(item)
+
+            return item
+
+        with self.assertRaises(KeyError):
+            utils.parallel_map(_func, ['ok', 'slow', 'fast'], workers=3)
+
+
+class TimeoutExecuteTestCase(unittest.TestCase):
+    def test_child_exits_after_closing_pipes(self):
+        _ret, _output, _ = utils.timeout_execute(
+            'echo done; exec >&- 2>&-; sleep 0.2; exit 3', timeout=10
+        )
+
+        self.assertEqual(_ret, 3)
+        self.assertEqual(_output, 'done\n')
+
+    def test_timeout_after_closing_pipes(self):
+        _start = time.time()
+        _ret, _, _error = utils.timeout_execute(
+            'exec >&- 2>&-; sleep 10', timeout=0.3
+        )
+
+        self.assertEqual(_ret, 1)
+        self.assertIn('expired', _error)
+        self.assertLess(time.time() - _start, 5)
+
+
+class IdentityTestCase(unittest.TestCase):
+    def setUp(self):
+        self._cache_path = settings.CACHE_PATH
+        settings.CACHE_PATH = tempfile.mkdtemp()
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(settings.CACHE_PATH)
+        settings.CACHE_PATH = self._cache_path
+
+    def _read(self, key, value):
+        def _func():
+            self.calls.append(key)
+            return value
+
+        return _func
+
+    def test_nested_identity_is_kept(self):
+        def _read_uuid():
+            self.calls.append('uuid')
+            if utils._identity('smbios', self._read('smbios', [2, 6])) >= [2, 6]:
+                return 'UUID-NEW'
+
+            return 'UUID-OLD'
+
+        self.assertEqual(utils._identity('uuid', _read_uuid), 'UUID-NEW')
+        self.assertEqual(utils._identity('uuid', _read_uuid), 'UUID-NEW')
+        self.assertEqual(
+            utils._identity('smbios', self._read('smbios', [3, 0])), [2, 6]
+        )
+        self.assertEqual(self.calls, ['uuid', 'smbios'])
+
+    def test_refresh_identity(self):
+        utils._identity('mac', self._read('mac', '001122334455'))
+        utils.refresh_identity()
+        utils._identity('mac', self._read('mac', '001122334455'))
+
+        self.assertEqual(self.calls, ['mac', 'mac'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2011-2020 Jose Antonio Chavarría <jachavar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of software inventory with synthetic dpkg status databases:
+    * dpkg_status reader vs 'dpkg-query --list' (previous Apt.query_all)
+    * utils.compare_lists vs difflib (previous implementation)
+
+Usage: python tools/benchmark_inventory.py [-s 5000,20000] [-r 5]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import difflib
+import tempfile
+import optparse
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from migasfree_client import utils
+from migasfree_client.backends import dpkg_status
+
+__author__ = 'Jose Antonio Chavarría'
+__license__ = 'GPLv3'
+
+CHANGED = 0.3  # ratio of packages changed between inventories
+
+
+def _paragraph(name, version, arch='amd64', multi_arch=None):
+    _lines = [
+        'Package: {0}'.format(name),
+        'Status: install ok installed',
+        'Priority: optional',
+        'Section: misc',
+        'Installed-Size: 1024',
+        'Maintainer: Nobody <nobody@example.com>',
+        'Architecture: {0}'.format(arch),
+    ]
+    if multi_arch:
+        _lines.append('Multi-Arch: {0}'.format(multi_arch))
+    _lines += [
+        'Version: {0}'.format(version),
+        'Depends: libc6 (>= 2.14), zlib1g (>= 1:1.1.4)',
+        'Description: synthetic package {0}'.format(name),
+        ' Long description of the package, first line.',
+        ' Long description of the package, second line.',
+        ' .',
+        ' Last line.',
+    ]
+
+    return '\n'.join(_lines) + '\n\n'
+
+
+def build_admindir(size):
+    """
+    string build_admindir(int size)
+    dpkg database directory with size installed packages
+    """
+
+    _path = tempfile.mkdtemp(prefix='mfc-bench-')
+    for _dir in ['info', 'updates']:
+        os.mkdir(os.path.join(_path, _dir))
+
+    with open(os.path.join(_path, 'status'), 'w') as _fp:
+        _fp.write(_paragraph('dpkg', '1.19.7'))
+        for _i in range(size - 1):
+            if _i % 10 == 0:
+                _fp.write(_paragraph(
+                    'lib{0:05d}'.format(_i), '1.{0}-1'.format(_i),
+                    multi_arch='same'
+                ))
+            elif _i % 4 == 0:
+                _fp.write(_paragraph(
+                    'pkg{0:05d}'.format(_i), '2.{0}'.format(_i), arch='all'
+                ))
+            else:
+                _fp.write(_paragraph(
+                    'pkg{0:05d}'.format(_i), '0.{0}+dfsg-2'.format(_i)
+                ))
+
+    return _path
+
+
+def dpkg_list(admindir):
+    # previous Apt.query_all implementation ('dpkg --list' runs dpkg-query)
+    _output = subprocess.Popen(
+        ['dpkg-query', '--admindir={0}'.format(admindir), '--list'],
+        stdout=subprocess.PIPE,
+        stderr=open(os.devnull, 'w'),
+        env=dict(os.environ, COLUMNS='200')
+    ).communicate()[0]
+    if sys.version_info[0] > 2:
+        _output = str(_output, encoding='utf8')
+
+    _result = []
+    for _line in _output.strip().splitlines():
+        if _line.startswith('ii'):
+            _tmp = re.split(' +', _line)
+            _result.append('{0}-{1}'.format(_tmp[1], _tmp[2]))
+
+    return _result
+
+
+def dpkg_reader(admindir):
+    dpkg_status._cache.clear()  # measures parsing, not cache
+
+    return dpkg_status.installed_packages(os.path.join(admindir, 'status'))
+
+
+def difflib_compare(a, b):
+    # previous utils.compare_lists implementation
+    _result = list(difflib.unified_diff(a, b, n=0))
+    for _line in _result[:]:
+        if _line.startswith('+++') or _line.startswith('---') \
+                or _line.startswith('@@'):
+            _result.remove(_line)
+
+    return sorted(_result)
+
+
+def best_time(func, repeat, *args):
+    _best = None
+    for _ in range(repeat):
+        _start = time.time()
+        func(*args)
+        _elapsed = time.time() - _start
+        if _best is None or _elapsed < _best:
+            _best = _elapsed
+
+    return _best
+
+
+def changed(packages):
+    _result = list(packages)
+    random.seed(len(packages))
+    for _i in random.sample(range(len(_result)), int(len(_result) * CHANGED)):
+        _result[_i] += '.1'
+
+    return sorted(_result)
+
+
+def main():
+    parser = optparse.OptionParser(description='Software inventory benchmark')
+    parser.add_option(
+        '--sizes', '-s', action='store', default='5000,20000',
+        help='installed packages (comma separated)'
+    )
+    parser.add_option(
+        '--repeat', '-r', action='store', type='int', default=5,
+        help='runs of each measure (best is shown)'
+    )
+    options, _ = parser.parse_args()
+
+    _dpkg = os.path.exists('/usr/bin/dpkg-query')  # only in Debian based systems
+
+    print('%8s %-24s %10s' % ('packages', 'measure', 'seconds'))
+    for _size in [int(_item) for _item in options.sizes.split(',')]:
+        _admindir = build_admindir(_size)
+        try:
+            _packages = dpkg_reader(_admindir)
+            assert len(_packages) == _size
+
+            if _dpkg:
+                assert dpkg_list(_admindir) == _packages
+                print('%8d %-24s %10.3f' % (
+                    _size, 'dpkg-query --list',
+                    best_time(dpkg_list, options.repeat, _admindir)
+                ))
+            print('%8d %-24s %10.3f' % (
+                _size, 'dpkg_status reader',
+                best_time(dpkg_reader, options.repeat, _admindir)
+            ))
+
+            _after = changed(_packages)
+            assert difflib_compare(_packages, _after) \
+                == utils.compare_lists(_packages, _after)
+            print('%8d %-24s %10.3f' % (
+                _size, 'difflib diff',
+                best_time(difflib_compare, options.repeat, _packages, _after)
+            ))
+            print('%8d %-24s %10.3f' % (
+                _size, 'compare_lists',
+                best_time(utils.compare_lists, options.repeat, _packages, _after)
+            ))
+        finally:
+            shutil.rmtree(_admindir)
+
+
+if __name__ == '__main__':
+    main()